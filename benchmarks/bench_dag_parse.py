@@ -0,0 +1,267 @@
+"""
+DAG parse-time, config merge and manifest-render benchmarks.
+
+Builds synthetic DAG folders with SequentialDag and custom_dag.DAG
+(SparkKubernetesOperator with spark_conf and spark_yaml), runs every case in a fresh
+interpreter and writes machine-readable results. Config merging is measured twice
+with the same DAGIFY_CONFIG_CACHE_DIR: a cold process and the next one, which reads
+merged configs from the on-disk cache like every later DAG parse does. Airflow Variables, S3 and Nexus are
+replaced by local stubs, so no network or metadata DB is needed. If dagify.old_operators is not
+installed, SequentialDag builds plain tasks instead of KubernetesOperatorWithSensor.
+
+Usage:
+    python benchmarks/bench_dag_parse.py --sizes 10 100 1000 5000 --output bench.json
+
+The report is written even if some cases fail, but the exit code is 1 then,
+so CI does not pass on a broken benchmark.
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+SCENARIOS = ("sequential_dag", "custom_dag_spark_conf", "custom_dag_spark_yaml")
+
+BASE_CONFIG = """\
+namespace: spark
+image: registry/spark-app
+node_selector: spark
+"""
+
+JOB_CONFIG = """\
+name: job-{i}
+main_application_file: local:///app/main.py
+args:
+  partition: {i}
+"""
+
+SEQUENTIAL_DAG = """\
+from dagify import SequentialDag, SparkJobConfig
+
+config = SparkJobConfig(key={base!r}, s3_conf=False)
+dag = SequentialDag(
+    dag_id="bench_sequential",
+    start_date="2024-01-01T00:00:00",
+    base_spark_job_config=config,
+    spark_job_configs_filepaths={files!r},
+).create_dag()
+"""
+
+CUSTOM_DAG_SPARK_CONF = """\
+from datetime import datetime
+
+from dagify import DAG, SparkKubernetesOperator
+from dagify.configs import SparkJobConf
+
+with DAG(dag_id="bench_spark_conf", start_date=datetime(2024, 1, 1), schedule_interval=None,
+         responsible=["bench"]) as dag:
+    for i in range({tasks}):
+        SparkKubernetesOperator(
+            spark_conf=SparkJobConf(
+                name=f"job-{{i}}",
+                image="registry/spark-app",
+                main_application_file="local:///app/main.py",
+                node_selector="spark",
+                args={{"partition": i}},
+            )
+        )
+"""
+
+CUSTOM_DAG_SPARK_YAML = """\
+from datetime import datetime
+
+from dagify import DAG, SparkKubernetesOperator
+
+with DAG(dag_id="bench_spark_yaml", start_date=datetime(2024, 1, 1), schedule_interval=None,
+         responsible=["bench"]) as dag:
+    for i in range({tasks}):
+        SparkKubernetesOperator(
+            spark_yaml={{
+                "metadata": {{"name": f"job-{{i}}", "namespace": "spark"}},
+                "spec": {{"image": "registry/spark-app:1.0.0", "args": [f"--partition={{i}}"]}},
+            }}
+        )
+"""
+
+# executed in a fresh interpreter: installs stubs, then measures import and parse
+CHILD = """\
+import importlib.util, json, resource, runpy, sys, time, types
+from unittest import mock
+
+mock.patch("airflow.models.Variable.get", lambda key, *args, **kwargs: f"stub-{key}").start()
+
+if importlib.util.find_spec("dagify.old_operators") is None:
+    # the legacy operator module is not shipped with every tree: SequentialDag gets a stand-in
+    # adding one plain task per job config, so config merging and DAG building are still measured
+    from airflow.models import BaseOperator
+
+    class KubernetesOperatorWithSensor:
+        def __init__(self, dag, namespace=None):
+            self.dag = dag
+
+        def __call__(self, spark_job_config):
+            return BaseOperator(task_id=spark_job_config["name"], dag=self.dag)
+
+    old_operators = types.ModuleType("dagify.old_operators")
+    old_operators.KubernetesOperatorWithSensor = KubernetesOperatorWithSensor
+    sys.modules["dagify.old_operators"] = old_operators
+
+start = time.perf_counter()
+import dagify
+if sys.argv[2] == "sequential_dag":
+    from dagify import SequentialDag
+else:
+    from dagify import SparkKubernetesOperator, DAG
+import_s = time.perf_counter() - start
+
+start = time.perf_counter()
+runpy.run_path(sys.argv[1])
+parse_s = time.perf_counter() - start
+
+print(json.dumps({
+    "import_s": import_s,
+    "parse_s": parse_s,
+    "peak_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+}))
+"""
+
+MERGE_CHILD = """\
+import json, sys, time
+from pathlib import Path
+from unittest import mock
+
+mock.patch("airflow.models.Variable.get", lambda key, *args, **kwargs: f"stub-{key}").start()
+
+from dagify.utils import SparkJobConfig
+
+folder = Path(sys.argv[1])
+files = sorted(folder.glob("job_*.yaml"))
+start = time.perf_counter()
+config = SparkJobConfig(key=str(folder / "base.yaml"), s3_conf=False)
+for path in files:
+    config.merge(path)
+elapsed = time.perf_counter() - start
+print(json.dumps({"configs": len(files), "elapsed_s": elapsed}))
+"""
+
+RENDER_CHILD = """\
+import json, sys, time
+from unittest import mock
+
+mock.patch("airflow.models.Variable.get", lambda key, *args, **kwargs: f"stub-{key}").start()
+mock.patch("dagify.configs.get_nexus_path", lambda image, **kwargs: image + ":1.0.0").start()
+mock.patch("dagify.configs.get_secrets_bundle", lambda keys: {key: f"stub-{key}" for key in keys}).start()
+
+from dagify.configs import K8sConf, SparkJobConf, get_k8s_body_with_spark
+
+renders = int(sys.argv[1])
+context = {"dag_run": None}
+start = time.perf_counter()
+for i in range(renders):
+    spark_conf = SparkJobConf(
+        name=f"job-{i}",
+        image="registry/spark-app",
+        main_application_file="local:///app/main.py",
+        node_selector="spark",
+        args={"partition": i},
+    )
+    get_k8s_body_with_spark(spark_conf, K8sConf(), context)
+elapsed = time.perf_counter() - start
+print(json.dumps({"renders": renders, "elapsed_s": elapsed, "renders_per_s": renders / elapsed}))
+"""
+
+
+def write_dag_folder(folder: Path, scenario: str, tasks: int) -> Path:
+    dag_file = folder / f"{scenario}_{tasks}.py"
+    if scenario == "sequential_dag":
+        base = folder / "base.yaml"
+        base.write_text(BASE_CONFIG)
+        files = []
+        for i in range(tasks):
+            job = folder / f"job_{i}.yaml"
+            job.write_text(JOB_CONFIG.format(i=i))
+            files.append(str(job))
+        dag_file.write_text(SEQUENTIAL_DAG.format(base=str(base), files=files))
+    elif scenario == "custom_dag_spark_conf":
+        dag_file.write_text(CUSTOM_DAG_SPARK_CONF.format(tasks=tasks))
+    else:
+        dag_file.write_text(CUSTOM_DAG_SPARK_YAML.format(tasks=tasks))
+    return dag_file
+
+
+def run_child(code: str, *args: str, env: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
+    result = subprocess.run([sys.executable, "-c", code, *args], capture_output=True, text=True,
+                            env={**os.environ, **env} if env else None)
+    if result.returncode != 0:
+        return {"error": result.stderr.strip().splitlines()[-1] if result.stderr else "failed"}
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def run_merge(sizes: List[int]) -> List[Dict[str, Any]]:
+    results = []
+    for tasks in sizes:
+        with tempfile.TemporaryDirectory() as folder:
+            write_dag_folder(Path(folder), "sequential_dag", tasks)
+            env = {"DAGIFY_CONFIG_CACHE_DIR": str(Path(folder) / "cache")}
+            for cache in ("cold", "warm"):
+                results.append({"tasks": tasks, "cache": cache, **run_child(MERGE_CHILD, folder, env=env)})
+                print(json.dumps(results[-1]), file=sys.stderr)
+    return results
+
+
+def run(sizes: List[int], renders: int) -> Dict[str, Any]:
+    results = []
+    for scenario in SCENARIOS:
+        for tasks in sizes:
+            with tempfile.TemporaryDirectory() as folder:
+                dag_file = write_dag_folder(Path(folder), scenario, tasks)
+                measurement = run_child(CHILD, str(dag_file), scenario)
+            results.append({"scenario": scenario, "tasks": tasks, **measurement})
+            print(json.dumps(results[-1]), file=sys.stderr)
+    return {
+        "meta": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+        },
+        "parse": results,
+        "merge": run_merge(sizes),
+        "render": run_child(RENDER_CHILD, str(renders)),
+    }
+
+
+def get_failed_cases(report: Dict[str, Any]) -> List[Dict[str, Any]]:
+    return [case for case in report["parse"] + report["merge"] + [report["render"]] if "error" in case]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 1000, 5000])
+    parser.add_argument("--renders", type=int, default=1000)
+    parser.add_argument("--output", type=Path, default=None, help="json file, stdout if not set")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    report = run(args.sizes, args.renders)
+    report["meta"]["total_s"] = time.perf_counter() - start
+    output = json.dumps(report, indent=2)
+    if args.output:
+        args.output.write_text(output)
+    else:
+        print(output)
+    failed = get_failed_cases(report)
+    if failed:
+        for case in failed:
+            print(f"benchmark case failed: {json.dumps(case)}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
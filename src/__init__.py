@@ -1,7 +1,33 @@
-from dagify.callbacks import TelegramCallback
-from dagify.constants import AIRFLOW_DEFAULT_CONFIG
-from dagify.dag_factory import BaseDagCreator, SequentialDag
-from dagify.old_operators import KubernetesOperatorWithSensor
-from dagify.operator import SparkKubernetesOperator
-from dagify.utils import SparkJobConfig
-from dagify.custom_dag import DAG
+from importlib import import_module
+from typing import Any
+
+# public names are imported on first access so that `import dagify`
+# does not pull boto3, kubernetes client and airflow providers at DAG parse time
+_EXPORTS = {
+    "TelegramCallback": "dagify.callbacks",
+    "AIRFLOW_DEFAULT_CONFIG": "dagify.constants",
+    "BaseDagCreator": "dagify.dag_factory",
+    "SequentialDag": "dagify.dag_factory",
+    "GraphDag": "dagify.dag_factory",
+    "KubernetesOperatorWithSensor": "dagify.old_operators",
+    "SparkKubernetesOperator": "dagify.operator",
+    "SparkKubernetesBatchOperator": "dagify.operator",
+    "SparkJobConfig": "dagify.utils",
+    "DependencyBundle": "dagify.dependencies",
+    "AdmissionController": "dagify.admission",
+    "DAG": "dagify.custom_dag",
+}
+
+__all__ = list(_EXPORTS)
+
+
+def __getattr__(name: str) -> Any:
+    if name not in _EXPORTS:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(import_module(_EXPORTS[name]), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(list(globals()) + __all__)
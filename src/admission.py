@@ -0,0 +1,210 @@
+import json
+import re
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from kubernetes import client
+from kubernetes.client.rest import ApiException
+from loguru import logger
+
+from dagify.constants import FAILURE_STATES, K8S_DEFAULT_CONF, SPARK_DEFAULT_CONF, SUCCESS_STATES
+from dagify.dag_utils import SPARK_APP_NAME_LABEL
+from dagify.hooks import CustomKubernetesHook
+from dagify.run_history import memory_to_mb
+
+ADMISSION_QUEUE_CONFIG_MAP = "dagify-admission-queue"
+QUANTITY_SUFFIXES = {
+    "Ki": 1 / 1024, "Mi": 1, "Gi": 1024, "Ti": 1024 ** 2,
+    "k": 1000 / 1024 ** 2, "M": 1000 ** 2 / 1024 ** 2, "G": 1000 ** 3 / 1024 ** 2, "T": 1000 ** 4 / 1024 ** 2,
+}
+
+
+def parse_cpu(quantity: str) -> float:
+    """'500m' -> 0.5, '2' -> 2.0"""
+    quantity = str(quantity)
+    return float(quantity[:-1]) / 1000 if quantity.endswith("m") else float(quantity)
+
+
+def parse_memory(quantity: str) -> float:
+    """Kubernetes memory quantity in MiB: '16Gi' -> 16384"""
+    match = re.fullmatch(r"([0-9.]+)([A-Za-z]*)", str(quantity))
+    if not match:
+        raise ValueError(f"Can not parse memory quantity {quantity}")
+    value, suffix = float(match.group(1)), match.group(2)
+    if not suffix:
+        return value / 1024 ** 2
+    return value * QUANTITY_SUFFIXES[suffix]
+
+
+def get_requested_resources(body: Dict[str, Any]) -> Tuple[float, float]:
+    """(cpu cores, memory MiB) requested by the driver and all executors, including spark memory overhead"""
+    spec = body["spec"]
+    overhead_factor = 0.4 if spec.get("type") == "Python" else 0.1
+
+    def pod_resources(pod: Dict[str, Any], default_memory: str, default_cores: int) -> Tuple[float, float]:
+        memory = memory_to_mb(pod.get("memory", default_memory))
+        return float(pod.get("cores", default_cores)), memory + max(384, memory * overhead_factor)
+
+    driver_cpu, driver_memory = pod_resources(
+        spec.get("driver", {}), SPARK_DEFAULT_CONF['driver_memory'], SPARK_DEFAULT_CONF['driver_cores'])
+    executor_cpu, executor_memory = pod_resources(
+        spec.get("executor", {}), SPARK_DEFAULT_CONF['executor_memory'], SPARK_DEFAULT_CONF['executor_cores'])
+    instances = spec.get("dynamicAllocation", {}).get("initialExecutors") \
+        or spec.get("executor", {}).get("instances", SPARK_DEFAULT_CONF['num_executors'])
+    return driver_cpu + executor_cpu * instances, driver_memory + executor_memory * instances
+
+
+def _pod_requests(pod: client.V1Pod) -> Tuple[float, float]:
+    cpu, memory = 0.0, 0.0
+    for container in pod.spec.containers:
+        requests = (container.resources and container.resources.requests) or {}
+        cpu += parse_cpu(requests.get("cpu", "0"))
+        memory += parse_memory(requests.get("memory", "0"))
+    return cpu, memory
+
+
+class AdmissionController:
+    """
+    Holds SparkApplication submission until the job fits into free capacity.
+    Capacity is the allocatable CPU/memory of the node pool (nodes labelled spark=<node selector>)
+    minus requests of the pods on it, or `quota` {'cpu': '64', 'memory': '256Gi'} of the namespace
+    minus requests of its pods.
+    Admitted applications keep their whole request reserved until their pods exist: for every
+    unfinished SparkApplication the part of its request not covered by its running or scheduled pods
+    is subtracted too, so jobs admitted a moment ago are not admitted twice over the same capacity.
+    Waiting jobs are kept in a ConfigMap queue, a job is admitted only if it fits together with
+    every waiting job of higher priority (airflow priority_weight) competing for the same node pool,
+    so jobs are admitted in priority order.
+    Args:
+        kubernetes_conn_id (str): airflow connection id
+        namespace (str): namespace of the applications and the queue
+        quota (Dict[str, str]): namespace quota, node pool capacity is used if not set
+        recheck_interval (float): seconds between admission checks of a waiting job
+        queue_entry_ttl (float): waiting entries older than this are ignored (task was killed)
+    """
+
+    def __init__(
+        self,
+        kubernetes_conn_id: str = 'kubernetes_default',
+        namespace: str = K8S_DEFAULT_CONF['namespace'],
+        quota: Optional[Dict[str, str]] = None,
+        recheck_interval: float = 60,
+        queue_entry_ttl: float = 600,
+    ) -> None:
+        self.kubernetes_conn_id = kubernetes_conn_id
+        self.namespace = namespace
+        self.quota = quota
+        self.recheck_interval = recheck_interval
+        self.queue_entry_ttl = queue_entry_ttl
+
+    @property
+    def core_api(self) -> client.CoreV1Api:
+        return client.CoreV1Api(CustomKubernetesHook(conn_id=self.kubernetes_conn_id).api_client)
+
+    @property
+    def custom_api(self) -> client.CustomObjectsApi:
+        return client.CustomObjectsApi(CustomKubernetesHook(conn_id=self.kubernetes_conn_id).api_client)
+
+    def get_pending_requests(self, pods: List[client.V1Pod], node_selector: Optional[str]) -> Tuple[float, float]:
+        """Requests of unfinished SparkApplications that their pods in `pods` do not cover yet"""
+        pod_requests: Dict[str, Tuple[float, float]] = {}
+        for pod in pods:
+            app_name = (pod.metadata.labels or {}).get(SPARK_APP_NAME_LABEL)
+            if app_name:
+                cpu, memory = pod_requests.get(app_name, (0.0, 0.0))
+                pod_cpu, pod_memory = _pod_requests(pod)
+                pod_requests[app_name] = (cpu + pod_cpu, memory + pod_memory)
+
+        applications = self.custom_api.list_namespaced_custom_object(
+            group=K8S_DEFAULT_CONF['api_group'],
+            version=K8S_DEFAULT_CONF['api_version'],
+            plural=K8S_DEFAULT_CONF['plural'],
+            namespace=self.namespace,
+        )["items"]
+        pending_cpu, pending_memory = 0.0, 0.0
+        for application in applications:
+            state = application.get("status", {}).get("applicationState", {}).get("state")
+            if state in SUCCESS_STATES or state in FAILURE_STATES:
+                continue
+            if not self.quota and application["spec"].get("driver", {}).get("nodeSelector", {}).get("spark") != node_selector:
+                continue
+            cpu, memory = get_requested_resources(application)
+            pods_cpu, pods_memory = pod_requests.get(application["metadata"]["name"], (0.0, 0.0))
+            pending_cpu += max(0.0, cpu - pods_cpu)
+            pending_memory += max(0.0, memory - pods_memory)
+        return pending_cpu, pending_memory
+
+    def get_free_resources(self, node_selector: Optional[str]) -> Tuple[float, float]:
+        active_pods = "status.phase!=Succeeded,status.phase!=Failed"
+        if self.quota:
+            pods = self.core_api.list_namespaced_pod(self.namespace, field_selector=active_pods).items
+            cpu, memory = parse_cpu(self.quota["cpu"]), parse_memory(self.quota["memory"])
+        else:
+            label_selector = f"spark={node_selector}" if node_selector else None
+            nodes = self.core_api.list_node(label_selector=label_selector).items
+            node_names = {node.metadata.name for node in nodes}
+            cpu = sum(parse_cpu(node.status.allocatable["cpu"]) for node in nodes)
+            memory = sum(parse_memory(node.status.allocatable["memory"]) for node in nodes)
+            pods = [pod for pod in self.core_api.list_pod_for_all_namespaces(field_selector=active_pods).items
+                    if pod.spec.node_name in node_names]
+        for pod in pods:
+            pod_cpu, pod_memory = _pod_requests(pod)
+            cpu -= pod_cpu
+            memory -= pod_memory
+        pending_cpu, pending_memory = self.get_pending_requests(pods, node_selector)
+        return cpu - pending_cpu, memory - pending_memory
+
+    def _update_queue(self, name: str, entry: Optional[Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+        """Adds (or removes if entry is None) a waiting job and returns the queue, retries on conflicts"""
+        for _ in range(5):
+            try:
+                config_map = self.core_api.read_namespaced_config_map(ADMISSION_QUEUE_CONFIG_MAP, self.namespace)
+            except ApiException as e:
+                if e.status != 404:
+                    raise
+                config_map = client.V1ConfigMap(
+                    metadata=client.V1ObjectMeta(name=ADMISSION_QUEUE_CONFIG_MAP, namespace=self.namespace), data={}
+                )
+            queue = {key: json.loads(value) for key, value in (config_map.data or {}).items()}
+            if entry is None:
+                if name not in queue:
+                    return queue
+                queue.pop(name)
+            else:
+                queue[name] = {**entry, "since": queue.get(name, entry)["since"]}
+            config_map.data = {key: json.dumps(value) for key, value in queue.items()}
+            try:
+                if config_map.metadata.resource_version:
+                    self.core_api.replace_namespaced_config_map(ADMISSION_QUEUE_CONFIG_MAP, self.namespace, config_map)
+                else:
+                    self.core_api.create_namespaced_config_map(self.namespace, config_map)
+                return queue
+            except ApiException as e:
+                if e.status != 409:
+                    raise
+        raise RuntimeError("Can not update the admission queue, too many conflicts")
+
+    def admit(self, name: str, body: Dict[str, Any], priority: int = 1) -> bool:
+        """True if the application can be submitted now, otherwise it waits in the queue"""
+        cpu, memory = get_requested_resources(body)
+        node_selector = body["spec"].get("driver", {}).get("nodeSelector", {}).get("spark")
+        # with a namespace quota every job of the queue competes for the same capacity
+        scope = None if self.quota else node_selector
+        now = time.time()
+        queue = self._update_queue(name, {"cpu": cpu, "memory": memory, "priority": priority, "since": now,
+                                          "updated": now, "scope": scope})
+        me = queue[name]
+        ahead: List[Dict[str, Any]] = [
+            entry for key, entry in queue.items()
+            if key != name and now - entry["updated"] < self.queue_entry_ttl and entry.get("scope") == scope
+            and (entry["priority"], -entry["since"]) > (me["priority"], -me["since"])
+        ]
+        free_cpu, free_memory = self.get_free_resources(node_selector)
+        free_cpu -= sum(entry["cpu"] for entry in ahead)
+        free_memory -= sum(entry["memory"] for entry in ahead)
+        if cpu <= free_cpu and memory <= free_memory:
+            self._update_queue(name, None)
+            return True
+        logger.info(f"{name} waits for {cpu} cpu, {memory:.0f}Mi: {free_cpu:.1f} cpu, {free_memory:.0f}Mi free "
+                    f"after {len(ahead)} jobs ahead")
+        return False
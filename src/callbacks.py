@@ -1,11 +1,10 @@
 from typing import List
 
-import requests
-from loguru import logger
 from omegaconf import OmegaConf
 from airflow.models import Variable
 
 from dagify.constants import SLA_EMOJI_CODE, FAILURE_EMOJI_CODE, DEV_FAILURE_EMOJI_CODE
+from dagify.notifiers import get_telegram_notifier
 
 
 class TelegramCallback:
@@ -14,7 +13,11 @@ class TelegramCallback:
     Args:
         chat_ids (List[str]): Telegram chat id's
         responsible (List[str]): List of telegram nicknames
-        token (str): telegram token
+        token (str): telegram token, `telegram_tkn` airflow Variable if not set
+        flush_timeout (float): seconds to wait for delivery before the callback returns
+    Airflow Variables are read on the first message, not at DAG parse time.
+    Callback processes end with os._exit, so atexit never runs there and every
+    callback waits for its own messages to be sent.
     """
 
     def __init__(
@@ -23,35 +26,47 @@ class TelegramCallback:
         token: str = None,
         message: str = None,  # for backward compatibility
         responsible: List[str] = None, # default value for backward compatibility
+        flush_timeout: float = 5,
     ) -> None:
         self.chat_ids = chat_ids
         self.responsible = responsible
-        self.host = Variable.get('self-host')
-        self.mode = Variable.get('MODE')
         self.sla_emoji_code = SLA_EMOJI_CODE
-        self.failure_emoji_code = FAILURE_EMOJI_CODE if self.mode != 'dev' else DEV_FAILURE_EMOJI_CODE
-        self.token = token
-
-
-    def __send_message(self, message: str, chat_id: str) -> None:
-        url = f"https://api.telegram.org/bot{self.token}/sendMessage"
+        self.flush_timeout = flush_timeout
+        self._token = token
+        self._host = None
+        self._mode = None
+
+    @property
+    def token(self) -> str:
+        if self._token is None:
+            self._token = Variable.get('telegram_tkn')
+        return self._token
+
+    @property
+    def host(self) -> str:
+        if self._host is None:
+            self._host = Variable.get('self-host')
+        return self._host
+
+    @property
+    def mode(self) -> str:
+        if self._mode is None:
+            self._mode = Variable.get('MODE')
+        return self._mode
+
+    @property
+    def failure_emoji_code(self) -> str:
+        return FAILURE_EMOJI_CODE if self.mode != 'dev' else DEV_FAILURE_EMOJI_CODE
+
+    def __send_message(self, message: str) -> None:
+        """Sends the message to every chat id, messages queued meanwhile go out in the same digest"""
         if self.responsible is not None:
             text = " @" + ", @".join(self.responsible) + "\n" + message
         else:
             text = message
-
-        payload = {
-            "text": text,
-            "parse_mode": "None",
-            "disable_web_page_preview": False,
-            "disable_notification": False,
-            "reply_to_message_id": None,
-            "chat_id": chat_id,
-        }
-        
-        headers = {"accept": "application/json", "content-type": "application/json"}
-        response = requests.post(url, json=payload, headers=headers)
-        logger.info(f"status code:{response.status_code}, cause: {response.text}")
+        notifier = get_telegram_notifier(self.token)
+        notifier.send(text, self.chat_ids)
+        notifier.flush(self.flush_timeout)
 
     def sla_callback(self, dag, **kwargs):
         """
@@ -70,7 +85,7 @@ class TelegramCallback:
         msg = f"{self.sla_emoji_code} WARN: Dag {dag_id} at {date_time} works longer than specified in sla." + "\n" + \
                 f"Dag by {log_url}\n" + tags
 
-        [self.__send_message(msg, chat_id) for chat_id in self.chat_ids]
+        self.__send_message(msg)
 
     def on_failure_callback(self, context_dict, **kwargs):
         """
@@ -89,5 +104,5 @@ class TelegramCallback:
         msg = f"{self.failure_emoji_code} ERROR: DAG \"{dag_id}\" failed at {failed_date}. \n" + \
                   f"Logs by {log_url}\n" + tags
 
-        [self.__send_message(msg, chat_id) for chat_id in self.chat_ids]
+        self.__send_message(msg)
 
@@ -1,14 +1,20 @@
-from typing import List, Optional, Dict, Union
-from io import StringIO
-from collections import defaultdict
+from typing import Any, List, Optional, Dict, Tuple, Union
+from copy import deepcopy
+from functools import lru_cache
 import yaml
 
-from airflow.models import Variable
 from airflow.utils.context import Context
 
 from dagify.nexus_path_extractor import get_nexus_path
+from dagify.secrets_bundle import get_secrets_bundle
+from dagify.run_history import RunHistoryStore, propose_resources
+from dagify.dependencies import DependencyBundle
 from dagify.constants import SPARK_DEFAULT_CONF, \
                             K8S_DEFAULT_CONF, \
+                            SPARK_CONF_SECRET_KEYS, \
+                            SPARK_JARS_PACKAGES, \
+                            SHUFFLE_STORAGES, \
+                            BATCH_SCHEDULERS, \
                             value_error_msg
 
 
@@ -17,7 +23,10 @@ class K8sConf:
                  repositories: Optional[List[str]] = None,
                  restart_policy: Optional[str] = None,
                  namespace: Optional[str] = None,
-                 image_pull_policy: Optional[str] = None):
+                 image_pull_policy: Optional[str] = None,
+                 batch_scheduler: Optional[str] = None,
+                 queue: Optional[str] = None,
+                 priority_class_name: Optional[str] = None):
 
         self.repositories: Optional[List[str]] = repositories
         """List of repositories."""
@@ -27,9 +36,21 @@ class K8sConf:
         """Namespace"""
         self.image_pull_policy: Optional[str]= image_pull_policy
         """Always/Never/IfNotPresent"""
+        self.batch_scheduler: Optional[str] = batch_scheduler
+        """volcano/yunikorn, admits all pods of an application together (gang scheduling)"""
+        self.queue: Optional[str] = queue
+        """Queue of the batch scheduler"""
+        self.priority_class_name: Optional[str] = priority_class_name
+        """PriorityClass of the application pods, higher priority applications preempt lower ones"""
 
     def __checking_parameters(self):
 
+        if self.batch_scheduler:
+            if self.batch_scheduler not in BATCH_SCHEDULERS:
+                raise ValueError(value_error_msg.format('batch_scheduler', f"Use one of {BATCH_SCHEDULERS}"))
+        if self.queue and not self.batch_scheduler:
+            raise ValueError(value_error_msg.format('queue', "It requires batch_scheduler"))
+
         if self.repositories:
             if type(self.repositories) is not list:
                 raise TypeError(value_error_msg.format('repositories', "The necessary format is a list, example: ['repository1', 'repository2', ..]"))
@@ -45,20 +66,54 @@ class K8sConf:
         self.__checking_parameters()
         self.__generate_base_config()
 
-        yaml_dict = defaultdict(dict)
-        yaml_dict['kind'] = K8S_DEFAULT_CONF['kind']
-        yaml_dict['metadata']['namespace'] = self.namespace if self.namespace else K8S_DEFAULT_CONF['namespace']
-        yaml_dict['apiVersion'] = K8S_DEFAULT_CONF['api_group'] + "/" + K8S_DEFAULT_CONF['api_version']
-        spec = defaultdict(dict)
-        spec['type'] = K8S_DEFAULT_CONF['type']
-        spec['mode'] = K8S_DEFAULT_CONF['mode']
-        spec['deps']['repositories'] = self.repositories
-        spec['imagePullPolicy'] = self.image_pull_policy if self.image_pull_policy else K8S_DEFAULT_CONF['image_pull_policy']
-        spec['timeToLiveSeconds'] = K8S_DEFAULT_CONF['time_to_live_seconds']
-        spec['sparkVersion'] = K8S_DEFAULT_CONF['api_group'] + "/" + K8S_DEFAULT_CONF['api_version']
-        spec['restartPolicy']['type'] = self.restart_policy if self.restart_policy else K8S_DEFAULT_CONF['restart_policy']
-        yaml_dict['spec'] = dict(spec)
-        return yaml_dict
+        return deepcopy(compile_base_template(
+            namespace=self.namespace if self.namespace else K8S_DEFAULT_CONF['namespace'],
+            image_pull_policy=self.image_pull_policy if self.image_pull_policy else K8S_DEFAULT_CONF['image_pull_policy'],
+            restart_policy=self.restart_policy if self.restart_policy else K8S_DEFAULT_CONF['restart_policy'],
+            repositories=tuple(self.repositories) if self.repositories else None,
+            batch_scheduler=self.batch_scheduler,
+            queue=self.queue,
+            priority_class_name=self.priority_class_name,
+        ))
+
+
+@lru_cache(maxsize=None)
+def compile_base_template(namespace: str,
+                          image_pull_policy: str,
+                          restart_policy: str,
+                          repositories: Optional[Tuple[str, ...]],
+                          batch_scheduler: Optional[str] = None,
+                          queue: Optional[str] = None,
+                          priority_class_name: Optional[str] = None) -> Dict[str, Any]:
+    """SparkApplication fields shared by every run, built once per distinct K8sConf. Must not be mutated"""
+    spec = {
+        'type': K8S_DEFAULT_CONF['type'],
+        'mode': K8S_DEFAULT_CONF['mode'],
+        'deps': {},
+        'imagePullPolicy': image_pull_policy,
+        'timeToLiveSeconds': K8S_DEFAULT_CONF['time_to_live_seconds'],
+        'sparkVersion': K8S_DEFAULT_CONF['api_group'] + "/" + K8S_DEFAULT_CONF['api_version'],
+        'restartPolicy': {'type': restart_policy},
+    }
+    if repositories:
+        spec['deps']['repositories'] = list(repositories)
+    if batch_scheduler:
+        spec['batchScheduler'] = batch_scheduler
+        spec['batchSchedulerOptions'] = {}
+        if queue:
+            spec['batchSchedulerOptions']['queue'] = queue
+        if priority_class_name:
+            spec['batchSchedulerOptions']['priorityClassName'] = priority_class_name
+    if priority_class_name:
+        spec['driver'] = {'priorityClassName': priority_class_name}
+        spec['executor'] = {'priorityClassName': priority_class_name}
+    return {
+        'kind': K8S_DEFAULT_CONF['kind'],
+        'metadata': {'namespace': namespace},
+        'apiVersion': K8S_DEFAULT_CONF['api_group'] + "/" + K8S_DEFAULT_CONF['api_version'],
+        'spec': spec,
+    }
+
 
 class SparkJobConf:
 
@@ -81,7 +136,18 @@ class SparkJobConf:
                  driver_java_options: Optional[str] = None,
                  executor_java_options: Optional[str] = None,
                  packages: Optional[List[str]] = None,
-                 args: Optional[Union[List,Dict]] = None
+                 args: Optional[Union[List,Dict]] = None,
+                 auto_size: bool = False,
+                 auto_size_bounds: Optional[Dict[str, Tuple]] = None,
+                 dynamic_allocation: bool = False,
+                 min_executors: Optional[int] = None,
+                 executor_idle_timeout: Optional[str] = None,
+                 pin_image_digest: bool = False,
+                 dependency_bundle: Optional[DependencyBundle] = None,
+                 shuffle_storage: Optional[str] = None,
+                 shuffle_storage_size: Optional[str] = None,
+                 shuffle_storage_class: Optional[str] = None,
+                 priority_class_name: Optional[str] = None
                  ):
 
         self.name: str = name
@@ -123,6 +189,31 @@ class SparkJobConf:
         """The path to executable python module"""
         self.args: Optional[Union[List,Dict]] = args
         """jobs arguments"""
+        self.auto_size: bool = auto_size
+        """Take driver_memory, executor_memory and num_executors from the run history instead of the values above"""
+        self.auto_size_bounds: Optional[Dict[str, Tuple]] = auto_size_bounds
+        """Limits of auto_size, for example {'executor_memory': ('1g', '8g'), 'num_executors': (1, 10)}"""
+        self.dynamic_allocation: bool = dynamic_allocation
+        """Scale executors between min_executors and max_executors, num_executors is the initial number"""
+        self.min_executors: Optional[int] = min_executors
+        """The minimum number of executors with dynamic_allocation"""
+        self.executor_idle_timeout: Optional[str] = executor_idle_timeout
+        """Idle executors are removed after this time with dynamic_allocation, for example 60s"""
+        self.pin_image_digest: bool = pin_image_digest
+        """Resolve the image tag to an immutable sha256 digest, so nodes can reuse cached images.
+            The digest is the manifest checksum of the image version in Nexus search results,
+            images with a tag that is not found in Nexus are not pinned"""
+        self.dependency_bundle: Optional[DependencyBundle] = dependency_bundle
+        """Take packages as jars from a published bundle instead of resolving them with Ivy on every run"""
+        self.shuffle_storage: Optional[str] = shuffle_storage
+        """Executor local (shuffle) storage: none, emptydir (node local disk), tmpfs (memory) or pvc. pvc by default"""
+        self.shuffle_storage_size: Optional[str] = shuffle_storage_size
+        """Size of the shuffle storage, for example 50Gi. Counts against executor memory for tmpfs"""
+        self.shuffle_storage_class: Optional[str] = shuffle_storage_class
+        """Storage class of the pvc shuffle storage"""
+        self.priority_class_name: Optional[str] = priority_class_name
+        """PriorityClass of the job pods, overrides K8sConf.priority_class_name"""
+        self._static_spec: Optional[Dict[str, Any]] = None
 
     def __checking_parameters(self):
         if self.driver_memory:
@@ -164,6 +255,23 @@ class SparkJobConf:
         if self.packages:
             if type(self.packages) is not list:
                 raise TypeError(value_error_msg.format('packages', "Enter packages in the list format"))
+        if self.max_executors:
+            if type(self.max_executors) is not int:
+                raise TypeError(value_error_msg.format('max_executors', "Enter the value of type int"))
+        if self.min_executors:
+            if type(self.min_executors) is not int:
+                raise TypeError(value_error_msg.format('min_executors', "Enter the value of type int"))
+        if self.dynamic_allocation:
+            if not self.max_executors:
+                raise ValueError(value_error_msg.format('max_executors', "It is required with dynamic_allocation"))
+            if (self.min_executors or 0) > self.max_executors \
+                    or (self.num_executors or SPARK_DEFAULT_CONF['num_executors']) > self.max_executors:
+                raise ValueError(value_error_msg.format('max_executors', "It must not be less than min_executors and num_executors"))
+        if self.shuffle_storage:
+            if self.shuffle_storage not in SHUFFLE_STORAGES:
+                raise ValueError(value_error_msg.format('shuffle_storage', f"Use one of {SHUFFLE_STORAGES}"))
+            if self.shuffle_storage == 'tmpfs' and not self.shuffle_storage_size:
+                raise ValueError(value_error_msg.format('shuffle_storage_size', "It is required for tmpfs, the size is taken from executor memory"))
         if self.args:
             if type(self.args) not in [list, dict]:
                 raise TypeError(value_error_msg.format('args', "Enter the values in the format of the dictionary or list"))
@@ -183,32 +291,40 @@ class SparkJobConf:
             dagrun_vars = dag_run_params.conf.get(key)
             return dagrun_vars
 
-    def get_spark_conf(self):
+    def get_spark_conf(self, secrets: Optional[Dict[str, str]] = None):
+        """secrets: values of SPARK_CONF_SECRET_KEYS, fetched with one batched lookup if not set"""
+        if secrets is None:
+            secrets = get_secrets_bundle(SPARK_CONF_SECRET_KEYS)
         extra_spark_conf = dict()
-        extra_spark_conf["spark.jars.packages"] = "org.postgresql:postgresql:42.5.0,com.clickhouse:clickhouse-jdbc:0.6.0,org.apache.httpcomponents.client5:httpclient5:5.3.1"
-        extra_spark_conf["spark.jars.ivy"] = "/tmp/ivy"
+        if not self.dependency_bundle:
+            extra_spark_conf["spark.jars.packages"] = ",".join(SPARK_JARS_PACKAGES)
+            extra_spark_conf["spark.jars.ivy"] = "/tmp/ivy"
 
-        extra_spark_conf["spark.hadoop.fs.s3a.endpoint"] = Variable.get("S3_ENDPOINT")
-        extra_spark_conf["spark.hadoop.fs.s3a.access.key"] = Variable.get("IT_AWS_ACCESS_KEY_ID")
-        extra_spark_conf["spark.hadoop.fs.s3a.secret.key"] = Variable.get("IT_AWS_SECRET_ACCESS_KEY")
+        extra_spark_conf["spark.hadoop.fs.s3a.endpoint"] = secrets["S3_ENDPOINT"]
+        extra_spark_conf["spark.hadoop.fs.s3a.access.key"] = secrets["IT_AWS_ACCESS_KEY_ID"]
+        extra_spark_conf["spark.hadoop.fs.s3a.secret.key"] = secrets["IT_AWS_SECRET_ACCESS_KEY"]
         extra_spark_conf["spark.hadoop.fs.s3a.connection.ssl.enabled"] = "false"
         extra_spark_conf["spark.hadoop.fs.s3a.aws.credentials.provider"] = "org.apache.hadoop.fs.s3a.SimpleAWSCredentialsProvider"
         extra_spark_conf["spark.hadoop.fs.s3a.path.style.access"] = "true"
         extra_spark_conf["spark.sql.catalogImplementation"] = "hive"
-        extra_spark_conf["spark.hadoop.javax.jdo.option.ConnectionURL"] = Variable.get("HIVE_METASTORE_URL")
-        extra_spark_conf["spark.hadoop.javax.jdo.option.ConnectionPassword"] = Variable.get("HIVE_METASTORE_PASSWORD")
-        extra_spark_conf["spark.hadoop.javax.jdo.option.ConnectionUserName"] = Variable.get("HIVE_METASTORE_USER")
+        extra_spark_conf["spark.hadoop.javax.jdo.option.ConnectionURL"] = secrets["HIVE_METASTORE_URL"]
+        extra_spark_conf["spark.hadoop.javax.jdo.option.ConnectionPassword"] = secrets["HIVE_METASTORE_PASSWORD"]
+        extra_spark_conf["spark.hadoop.javax.jdo.option.ConnectionUserName"] = secrets["HIVE_METASTORE_USER"]
         extra_spark_conf["spark.hadoop.javax.jdo.option.ConnectionDriverName"] = "org.postgresql.Driver"
 
-        extra_spark_conf["spark.kubernetes.executor.volumes.persistentVolumeClaim.data.options.claimName"] = "OnDemand"
-        extra_spark_conf["spark.kubernetes.executor.volumes.persistentVolumeClaim.data.options.storageClass"] = "yc-network-ssd"
-        extra_spark_conf["spark.kubernetes.executor.volumes.persistentVolumeClaim.data.options.sizeLimit"] = "50Gi"
-        extra_spark_conf["spark.kubernetes.executor.volumes.persistentVolumeClaim.data.mount.path"] = "/data"
+        extra_spark_conf.update(self.get_shuffle_storage_conf())
         extra_spark_conf["spark.kubernetes.submission.connectionTimeout"] = "60000"
         extra_spark_conf["spark.kubernetes.submission.requestTimeout"] = "60000"
         extra_spark_conf["spark.kubernetes.driver.connectionTimeout"] = "60000"
         extra_spark_conf["spark.kubernetes.driver.requestTimeout"] = "60000"
 
+        if self.dynamic_allocation:
+            extra_spark_conf["spark.dynamicAllocation.enabled"] = "true"
+            # there is no external shuffle service on kubernetes, shuffle files are tracked instead
+            extra_spark_conf["spark.dynamicAllocation.shuffleTracking.enabled"] = "true"
+            extra_spark_conf["spark.dynamicAllocation.executorIdleTimeout"] = \
+                self.executor_idle_timeout if self.executor_idle_timeout else SPARK_DEFAULT_CONF['executor_idle_timeout']
+
         if self.spark_conf_overrides:
             for i in self.spark_conf_overrides:
                 split_config = i.split("=")
@@ -216,11 +332,36 @@ class SparkJobConf:
         return extra_spark_conf
 
 
+    def get_shuffle_storage_conf(self) -> Dict[str, str]:
+        """Executor volume for spark local dirs, spark uses volumes named spark-local-dir-* for shuffle and spill"""
+        storage = self.shuffle_storage if self.shuffle_storage else SPARK_DEFAULT_CONF['shuffle_storage']
+        if storage == 'none':
+            return {}
+        size = self.shuffle_storage_size if self.shuffle_storage_size else SPARK_DEFAULT_CONF['shuffle_storage_size']
+        mount_path = SPARK_DEFAULT_CONF['shuffle_mount_path']
+        if storage == 'pvc':
+            prefix = "spark.kubernetes.executor.volumes.persistentVolumeClaim.spark-local-dir-1"
+            conf = {
+                f"{prefix}.options.claimName": "OnDemand",
+                f"{prefix}.options.storageClass": self.shuffle_storage_class if self.shuffle_storage_class
+                else SPARK_DEFAULT_CONF['shuffle_storage_class'],
+                f"{prefix}.options.sizeLimit": size,
+            }
+        else:
+            prefix = "spark.kubernetes.executor.volumes.emptyDir.spark-local-dir-1"
+            conf = {f"{prefix}.options.sizeLimit": size}
+            if storage == 'tmpfs':
+                conf[f"{prefix}.options.medium"] = "Memory"
+        conf[f"{prefix}.mount.path"] = mount_path
+        conf[f"{prefix}.mount.readOnly"] = "false"
+        conf["spark.local.dir"] = mount_path
+        return conf
+
     def __set_envs(self, context: Context):
         envs = {}
 
         if self.envs:
-            envs = self.envs
+            envs = dict(self.envs)
 
         envs_from_dagrun_conf = self.get_vars_dagrun_conf(context, "envs")
         if envs_from_dagrun_conf:
@@ -234,6 +375,10 @@ class SparkJobConf:
             return base_packages + self.packages
         return base_packages
 
+    def get_package_coordinates(self) -> List[str]:
+        """All maven packages of the job: spark.jars.packages and deps.packages"""
+        return list(dict.fromkeys(SPARK_JARS_PACKAGES + self.__get_packages()))
+
     def __set_args(self, context: Context):
         args = []
         args_from_dagrun_conf = self.get_vars_dagrun_conf(context, "args")
@@ -253,56 +398,113 @@ class SparkJobConf:
     def  __set_core_limits(cores, limits):
         return limits if limits else f'{cores * 1000}m'
 
-    def generate_config(self, context: Context):
+    def __apply_auto_size(self) -> None:
+        current = {
+            'driver_memory': self.driver_memory if self.driver_memory else SPARK_DEFAULT_CONF['driver_memory'],
+            'executor_memory': self.executor_memory if self.executor_memory else SPARK_DEFAULT_CONF['executor_memory'],
+            'num_executors': self.num_executors if self.num_executors else SPARK_DEFAULT_CONF['num_executors'],
+        }
+        proposal = propose_resources(RunHistoryStore().recent(self.name), current, self.auto_size_bounds)
+        self.driver_memory = proposal['driver_memory']
+        self.executor_memory = proposal['executor_memory']
+        self.num_executors = proposal['num_executors']
+
+    def __generate_static_spec(self) -> Dict[str, Any]:
+        """Spec fields that do not change between runs, built once per SparkJobConf"""
         self.__checking_parameters()
-        self.envs = self.__set_envs(context)
-
-        yaml_dict = defaultdict(dict)
-        yaml_dict['metadata']['name'] = self.name
-        spec = defaultdict(dict)
-        spec['arguments'] = self.__set_args(context)
-        spec['sparkConf'] = self.spark_conf_overrides
-        spec['deps']['packages'] = self.__get_packages()
-        spec['image'] = get_nexus_path(self.image)
-        spec['mainApplicationFile'] = self.main_application_file
-        spec['volumes'] = [{'name': 'test-volume', 'hostPath': {'path': '/tmp', 'type': "Directory"}}]
-        spec_driver = defaultdict(dict)
-        spec_driver['memory'] = self.driver_memory if self.driver_memory else SPARK_DEFAULT_CONF['driver_memory']
-        spec_driver['cores'] = self.driver_cores if self.driver_cores else SPARK_DEFAULT_CONF['driver_cores']
-        spec_driver['coreLimit'] = self.__set_core_limits(spec_driver['cores'], self.driver_core_limit)
-        spec_driver['labels']['version'] = SPARK_DEFAULT_CONF['label_version']
-        spec_driver['volumeMounts'] = SPARK_DEFAULT_CONF['volume_mounts']
-        spec_driver['serviceAccount'] = SPARK_DEFAULT_CONF['service_account']
-        spec_driver['env'] = self.envs
+        if self.auto_size:
+            self.__apply_auto_size()
+        driver_cores = self.driver_cores if self.driver_cores else SPARK_DEFAULT_CONF['driver_cores']
+        spec_driver = {
+            'memory': self.driver_memory if self.driver_memory else SPARK_DEFAULT_CONF['driver_memory'],
+            'cores': driver_cores,
+            'coreLimit': self.__set_core_limits(driver_cores, self.driver_core_limit),
+            'labels': {'version': SPARK_DEFAULT_CONF['label_version']},
+            'volumeMounts': SPARK_DEFAULT_CONF['volume_mounts'],
+            'serviceAccount': SPARK_DEFAULT_CONF['service_account'],
+        }
         if self.env_from:
             spec_driver['envFrom'] = [{'secretRef': {'name': self.env_from}}]
-        spec_driver['nodeSelector']['spark'] = self.node_selector
-        spec['driver'] = dict(spec_driver)
-        spec_executor = defaultdict(dict)
-        spec_executor["cores"] = self.executor_cores if self.executor_cores else SPARK_DEFAULT_CONF['executor_cores']
-        spec_executor["coreLimit"] = self.__set_core_limits(spec_executor['cores'], self.executor_core_limit)
-        spec_executor['memory'] = self.executor_memory if self.executor_memory else SPARK_DEFAULT_CONF['executor_memory']
-        spec_executor['labels']['version'] = SPARK_DEFAULT_CONF['label_version']
-        spec_executor['env'] = self.envs
+        spec_driver['nodeSelector'] = {'spark': self.node_selector}
+
+        executor_cores = self.executor_cores if self.executor_cores else SPARK_DEFAULT_CONF['executor_cores']
+        spec_executor = {
+            'cores': executor_cores,
+            'coreLimit': self.__set_core_limits(executor_cores, self.executor_core_limit),
+            'memory': self.executor_memory if self.executor_memory else SPARK_DEFAULT_CONF['executor_memory'],
+            'labels': {'version': SPARK_DEFAULT_CONF['label_version']},
+        }
         if self.env_from:
-            spec_executor['envFrom'] = [{'secretRef':{'name':self.env_from}}]
+            spec_executor['envFrom'] = [{'secretRef': {'name': self.env_from}}]
         spec_executor['instances'] = self.num_executors if self.num_executors else SPARK_DEFAULT_CONF['num_executors']
-        spec_executor['nodeSelector']['spark'] = self.node_selector
-        spec['executor'] = dict(spec_executor)
+        spec_executor['nodeSelector'] = {'spark': self.node_selector}
+
+        if self.dependency_bundle:
+            deps = {'jars': self.dependency_bundle.get_jars(self.get_package_coordinates())}
+        else:
+            deps = {'packages': self.__get_packages()}
+        static_spec = {
+            'deps': deps,
+            'mainApplicationFile': self.main_application_file,
+            'volumes': [{'name': 'test-volume', 'hostPath': {'path': '/tmp', 'type': "Directory"}}],
+            'driver': spec_driver,
+            'executor': spec_executor,
+        }
+        if self.priority_class_name:
+            spec_driver['priorityClassName'] = self.priority_class_name
+            spec_executor['priorityClassName'] = self.priority_class_name
+        jars_volume = self.dependency_bundle.volume() if self.dependency_bundle else None
+        if jars_volume:
+            static_spec['volumes'].append(jars_volume[0])
+            spec_driver['volumeMounts'] = spec_driver['volumeMounts'] + [jars_volume[1]]
+            spec_executor['volumeMounts'] = [jars_volume[1]]
+        if self.dynamic_allocation:
+            static_spec['dynamicAllocation'] = {
+                'enabled': True,
+                'initialExecutors': spec_executor['instances'],
+                'minExecutors': self.min_executors if self.min_executors else SPARK_DEFAULT_CONF['min_executors'],
+                'maxExecutors': self.max_executors,
+            }
+        return static_spec
+
+    def generate_config(self, context: Context) -> Dict[str, Any]:
+        if self._static_spec is None:
+            self._static_spec = self.__generate_static_spec()
+        static_spec = deepcopy(self._static_spec)
+        envs = self.__set_envs(context)
+
+        spec = {
+            'arguments': self.__set_args(context),
+            'image': get_nexus_path(self.image, pin_digest=self.pin_image_digest),
+            **static_spec,
+        }
+        spec['driver']['env'] = envs
+        spec['executor']['env'] = list(envs)
         spec['sparkConf'] = self.get_spark_conf()
-        yaml_dict['spec'] = dict(spec)
+        return {'metadata': {'name': self.name}, 'spec': spec}
 
-        return yaml_dict
 
-
-def get_k8s_yaml_with_spark(spark_conf: SparkJobConf, k8s_conf: K8sConf, context: Context) -> str:
-    spark_conf_yaml = spark_conf.generate_config(context)
-    k8s_conf_yaml = k8s_conf.generate_config()
-    for key, value in spark_conf_yaml.items():
+def get_k8s_body_with_spark(spark_conf: SparkJobConf, k8s_conf: K8sConf, context: Context) -> Dict[str, Any]:
+    """Renders the SparkApplication body, ready to be passed to create_custom_object"""
+    if spark_conf.dependency_bundle and k8s_conf.repositories \
+            and not set(k8s_conf.repositories) <= set(spark_conf.dependency_bundle.repositories):
+        raise ValueError(value_error_msg.format(
+            'repositories', "The dependency bundle must be published with the repositories of K8sConf"))
+    body = k8s_conf.generate_config()
+    for key, value in spark_conf.generate_config(context).items():
         for subkey, subvalue in value.items():
-            k8s_conf_yaml[key][subkey] = subvalue
+            if isinstance(subvalue, dict) and isinstance(body[key].get(subkey), dict):
+                body[key][subkey] = {**body[key][subkey], **subvalue}
+            else:
+                body[key][subkey] = subvalue
+    priority_class_name = body['spec']['driver'].get('priorityClassName')
+    if 'batchScheduler' in body['spec'] and priority_class_name:
+        body['spec']['batchSchedulerOptions']['priorityClassName'] = priority_class_name
+    if k8s_conf.image_pull_policy is None and '@sha256:' in body['spec']['image']:
+        # a digest never points to another image, so the node cache is always valid
+        body['spec']['imagePullPolicy'] = 'IfNotPresent'
+    return body
 
-    yaml_output = StringIO()
-    yaml_output.write(yaml.dump(dict(k8s_conf_yaml), default_flow_style=False, sort_keys=False))
-    application_file = yaml_output.getvalue().replace("\"\'", "\"").replace("\'\"", "\"")
-    return application_file
+
+def get_k8s_yaml_with_spark(spark_conf: SparkJobConf, k8s_conf: K8sConf, context: Context) -> str:
+    return yaml.dump(get_k8s_body_with_spark(spark_conf, k8s_conf, context), default_flow_style=False, sort_keys=False)
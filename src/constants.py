@@ -23,13 +23,21 @@ SPARK_DEFAULT_CONF = dict(
         driver_memory='600m',
         driver_cores=1,
         num_executors=1,
+        min_executors=0,
+        executor_idle_timeout='60s',
         executor_memory='600m',
         executor_cores=1,
         label_version='3.3.1',
-        volume_mounts=[{'name': '\"test-volume\"', 'mountPath': '\"/tmp\"'}],
-        service_account='spark'
+        volume_mounts=[{'name': 'test-volume', 'mountPath': '/tmp'}],
+        service_account='spark',
+        shuffle_storage='pvc',
+        shuffle_storage_class='yc-network-ssd',
+        shuffle_storage_size='50Gi',
+        shuffle_mount_path='/data'
     )
 
+SHUFFLE_STORAGES = ('none', 'emptydir', 'tmpfs', 'pvc')
+
 K8S_DEFAULT_CONF = dict(
         mode="cluster",
         namespace='spark',
@@ -50,4 +58,41 @@ value_error_msg = "The incorrect value {}. {}"
 FAILURE_STATES = ("FAILED", "UNKNOWN")
 RUNNING_STATES = ("RUNNING",)
 PENDING_STATES = ("PENDING", "SUBMITTED")
-SUCCESS_STATES = ("COMPLETED",)
\ No newline at end of file
+SUCCESS_STATES = ("COMPLETED",)
+
+SPARK_CONF_SECRET_KEYS = (
+    "S3_ENDPOINT",
+    "IT_AWS_ACCESS_KEY_ID",
+    "IT_AWS_SECRET_ACCESS_KEY",
+    "HIVE_METASTORE_URL",
+    "HIVE_METASTORE_PASSWORD",
+    "HIVE_METASTORE_USER",
+)
+# sparkConf settings filled from SPARK_CONF_SECRET_KEYS, their values change when secrets are rotated
+SPARK_CONF_SECRET_SETTINGS = (
+    "spark.hadoop.fs.s3a.endpoint",
+    "spark.hadoop.fs.s3a.access.key",
+    "spark.hadoop.fs.s3a.secret.key",
+    "spark.hadoop.javax.jdo.option.ConnectionURL",
+    "spark.hadoop.javax.jdo.option.ConnectionPassword",
+    "spark.hadoop.javax.jdo.option.ConnectionUserName",
+)
+SECRETS_BUNDLE_TTL_SECONDS = 300
+NEXUS_CACHE_TTL_SECONDS = 600
+S3_CONFIG_CACHE_TTL_SECONDS = 300
+MERGED_CONFIG_CACHE_MAX_FILES = 10000
+MERGED_CONFIG_CACHE_PRUNE_INTERVAL = 500
+API_CLIENT_POOL_MAXSIZE = 32
+API_CLIENT_TTL_SECONDS = 600
+AUTO_SIZE_DEFAULT_BOUNDS = dict(
+        driver_memory=('600m', '8g'),
+        executor_memory=('600m', '16g'),
+        num_executors=(1, 20),
+    )
+MAVEN_REPOSITORY = "https://repo1.maven.org/maven2"
+SPARK_JARS_PACKAGES = [
+    "org.postgresql:postgresql:42.5.0",
+    "com.clickhouse:clickhouse-jdbc:0.6.0",
+    "org.apache.httpcomponents.client5:httpclient5:5.3.1",
+]
+BATCH_SCHEDULERS = ('volcano', 'yunikorn')
@@ -1,7 +1,6 @@
 from typing import List
 
 from airflow import DAG as AIRFLOW_DAG
-from airflow.models import Variable
 
 from dagify.callbacks import TelegramCallback
 
@@ -10,7 +9,7 @@ class DAG(AIRFLOW_DAG):
     def __init__(
             self,
             responsible: List[str] = None,
-            token: str = Variable.get('telegram_tkn'),
+            token: str = None,
             chat_ids: List[str] = ["-695531404"],
             **kwargs):
         if responsible:
@@ -5,9 +5,9 @@ from typing import Any, Dict, List, Optional, Union
 
 from airflow import DAG
 from airflow.models.baseoperator import chain
-from airflow.models import Variable
 
-from dagify.old_operators import KubernetesOperatorWithSensor
+from dagify.constants import K8S_DEFAULT_CONF
+from dagify.operator import SparkKubernetesOperator
 from dagify.utils import SparkJobConfig
 from dagify.callbacks import TelegramCallback
 
@@ -23,7 +23,7 @@ class BaseDagCreator(ABC):
         base_spark_job_config: SparkJobConfig = None,
         additional_dag_params: Optional[Dict[str, Any]] = None,
         responsible: List[str] = None,
-        token: str = Variable.get("telegram_tkn"),
+        token: str = None,
         chat_ids: List[str] = ["-695531404"],
         **kwargs
     ):
@@ -66,6 +66,9 @@ class SequentialDag(BaseDagCreator):
         self.spark_job_configs_filepaths = spark_job_configs_filepaths
 
     def create_dag(self) -> DAG:
+        # the legacy operator module is optional, GraphDag does not need it
+        from dagify.old_operators import KubernetesOperatorWithSensor
+
         with super().get_dag() as dag:
 
             operator = KubernetesOperatorWithSensor(dag=dag, namespace=self.namespace)
@@ -78,3 +81,79 @@ class SequentialDag(BaseDagCreator):
                 ]
             )
         return dag
+
+
+class GraphDag(BaseDagCreator):
+    """
+    Dag with dependencies described in the spark job configs, independent jobs run in parallel.
+    Every job config may contain the keys:
+        depends_on: names (metadata.name) of jobs that must finish first
+        stage: integer, the job waits for every job of the previous stage (ignored if depends_on is set)
+        pool: airflow pool of the job, the `pool` argument if not set, otherwise airflow default pool
+    Jobs with neither depends_on nor stage start right away.
+    Pools limit concurrency per group, they can be created with `dag_utils.create_pools`
+    """
+
+    def __init__(
+        self,
+        *args,
+        spark_job_configs_filepaths: List[Union[str, Path]],
+        max_active_tasks: Optional[int] = None,
+        pool: Optional[str] = None,
+        **kwargs
+    ):
+        super().__init__(*args, **kwargs)
+        self.spark_job_configs_filepaths = spark_job_configs_filepaths
+        self.pool = pool
+        if max_active_tasks is not None:
+            self.additional_dag_params["max_active_tasks"] = max_active_tasks
+
+    def get_jobs(self) -> Dict[str, Dict[str, Any]]:
+        jobs = {}
+        for _spark_job_config_filepath in self.spark_job_configs_filepaths:
+            spark_yaml = self.config.merge(_spark_job_config_filepath)
+            name = spark_yaml["metadata"]["name"]
+            if name in jobs:
+                raise ValueError(f"Duplicated spark job name: {name}")
+            spark_yaml["metadata"].setdefault(
+                "namespace", self.namespace if self.namespace else K8S_DEFAULT_CONF["namespace"]
+            )
+            jobs[name] = {
+                "depends_on": spark_yaml.pop("depends_on", None) or [],
+                "stage": spark_yaml.pop("stage", None),
+                "pool": spark_yaml.pop("pool", None) or self.pool,
+                "spark_yaml": spark_yaml,
+            }
+        return jobs
+
+    @staticmethod
+    def get_upstream(jobs: Dict[str, Dict[str, Any]]) -> Dict[str, List[str]]:
+        stages = sorted({job["stage"] for job in jobs.values() if job["stage"] is not None})
+        upstream = {}
+        for name, job in jobs.items():
+            if job["depends_on"]:
+                unknown = set(job["depends_on"]) - set(jobs)
+                if unknown:
+                    raise ValueError(f"Job {name} depends on unknown jobs: {sorted(unknown)}")
+                upstream[name] = list(job["depends_on"])
+            elif job["stage"] is not None and stages.index(job["stage"]) > 0:
+                previous_stage = stages[stages.index(job["stage"]) - 1]
+                upstream[name] = [n for n, j in jobs.items() if j["stage"] == previous_stage]
+            else:
+                upstream[name] = []
+        return upstream
+
+    def create_dag(self) -> DAG:
+        jobs = self.get_jobs()
+        upstream = self.get_upstream(jobs)
+        with super().get_dag() as dag:
+            tasks = {
+                name: SparkKubernetesOperator(spark_yaml=job["spark_yaml"], dag=dag,
+                                              **({"pool": job["pool"]} if job["pool"] else {}))
+                for name, job in jobs.items()
+            }
+            for name, upstream_names in upstream.items():
+                for upstream_name in upstream_names:
+                    tasks[upstream_name] >> tasks[name]
+        return dag
+
@@ -1,9 +1,18 @@
-from time import sleep
-from typing import List
+from time import monotonic
+from typing import Any, Callable, Dict, Iterable, List, Set
 
 from airflow import DAG
-from airflow.models import taskinstance
+from airflow.exceptions import AirflowException
+from airflow.models import Pool, taskinstance
 from airflow.utils.db import provide_session
+from kubernetes import client, watch
+from kubernetes.client.rest import ApiException
+from loguru import logger
+
+from dagify.constants import K8S_DEFAULT_CONF
+from dagify.hooks import CustomKubernetesHook
+
+SPARK_APP_NAME_LABEL = "sparkoperator.k8s.io/app-name"
 
 
 @provide_session
@@ -21,9 +30,120 @@ def clear_tasks(
     )
 
 
-def clear_upstream_task(context) -> None:
-    sleep(120)  # wait for spark application garbage collector
+@provide_session
+def create_pools(pools: Dict[str, int], session=None) -> None:
+    """Creates or resizes airflow pools, e.g. {"spark-spark": 10}. Meant for deploy time, not DAG files"""
+    for name, slots in pools.items():
+        pool = session.query(Pool).filter(Pool.pool == name).one_or_none()
+        if pool is None:
+            session.add(Pool(pool=name, slots=slots, description="dagify spark jobs"))
+        else:
+            pool.slots = slots
+    session.commit()
+
+
+def _get_items(response: Any) -> List[Any]:
+    return response["items"] if isinstance(response, dict) else response.items
+
+
+def _get_resource_version(response: Any) -> str:
+    return response["metadata"]["resourceVersion"] if isinstance(response, dict) else response.metadata.resource_version
+
+
+def _wait_deleted(list_func: Callable, key: Callable[[Any], str], names: Set[str], deadline: float, **kwargs) -> None:
+    """Lists objects, then watches DELETED events until none of `names` is left"""
+    while True:
+        response = list_func(**kwargs)
+        remaining = names & {key(item) for item in _get_items(response)}
+        if not remaining:
+            return
+        timeout = int(deadline - monotonic())
+        if timeout <= 0:
+            raise AirflowException(f"Timeout waiting for deletion of {sorted(remaining)}")
+        for event in watch.Watch().stream(list_func,
+                                          resource_version=_get_resource_version(response),
+                                          timeout_seconds=timeout,
+                                          **kwargs):
+            if event["type"] == "ERROR":
+                break
+            if event["type"] == "DELETED":
+                remaining.discard(key(event["object"]))
+                if not remaining:
+                    return
+
+
+def _custom_object_name(obj: Dict[str, Any]) -> str:
+    return obj["metadata"]["name"]
+
+
+def _driver_app_name(pod: Any) -> str:
+    if isinstance(pod, dict):
+        return pod["metadata"].get("labels", {}).get(SPARK_APP_NAME_LABEL, "")
+    return (pod.metadata.labels or {}).get(SPARK_APP_NAME_LABEL, "")
+
+
+def wait_for_spark_applications_deleted(
+    names: Iterable[str],
+    namespace: str = K8S_DEFAULT_CONF['namespace'],
+    kubernetes_conn_id: str = 'kubernetes_default',
+    timeout: float = 300,
+    delete: bool = False,
+) -> None:
+    """
+    Returns as soon as the SparkApplications and their driver pods are gone.
+    With delete=True the applications are deleted first instead of waiting for the garbage collector.
+    Raises AirflowException after `timeout` seconds.
+    """
+    names = set(names)
+    if not names:
+        return
+    hook = CustomKubernetesHook(conn_id=kubernetes_conn_id)
+    custom_api = client.CustomObjectsApi(hook.api_client)
+    core_api = client.CoreV1Api(hook.api_client)
+    deadline = monotonic() + timeout
+    app_kwargs = dict(
+        group=K8S_DEFAULT_CONF['api_group'],
+        version=K8S_DEFAULT_CONF['api_version'],
+        plural=K8S_DEFAULT_CONF['plural'],
+        namespace=namespace,
+    )
+
+    if delete:
+        for name in names:
+            try:
+                custom_api.delete_namespaced_custom_object(name=name, **app_kwargs)
+            except ApiException as e:
+                if e.status != 404:
+                    raise
+
+    _wait_deleted(custom_api.list_namespaced_custom_object, _custom_object_name, names, deadline, **app_kwargs)
+    _wait_deleted(core_api.list_namespaced_pod, _driver_app_name, names, deadline,
+                  namespace=namespace,
+                  label_selector=f"spark-role=driver,{SPARK_APP_NAME_LABEL} in ({','.join(sorted(names))})")
+
+
+def clear_upstream_task(context, timeout: float = 300, delete: bool = True) -> None:
+    """
+    Clears tasks from params["tasks_to_clear"] once their SparkApplications are deleted.
+    The applications are deleted first, a finished application of the same run would otherwise
+    be reattached by the operator instead of running again. Use functools.partial to change timeout
+    or to wait for the GC instead (delete=False).
+    If the applications are still there after `timeout` seconds the tasks are cleared anyway
+    """
     tasks_to_clear = context["params"].get("tasks_to_clear", [])
+    spark_applications: Dict[str, Set[str]] = {}
+    for task_id in tasks_to_clear:
+        if not context["dag"].has_task(task_id):
+            continue
+        task = context["dag"].get_task(task_id)
+        namespace = getattr(task, "namespace", None) or K8S_DEFAULT_CONF['namespace']
+        spark_applications.setdefault(namespace, set()).add(getattr(task, "name", task_id))
+    for namespace, names in spark_applications.items():
+        try:
+            wait_for_spark_applications_deleted(names, namespace=namespace, timeout=timeout, delete=delete)
+        except AirflowException as e:
+            logger.warning(f"Clearing tasks without waiting for deletion in {namespace}: {e}")
+
     all_tasks = context["dag_run"].get_task_instances()
     tasks_to_clear = [ti for ti in all_tasks if ti.task_id in tasks_to_clear]
     clear_tasks(tasks_to_clear, dag=context["dag"])
@@ -0,0 +1,184 @@
+import argparse
+import hashlib
+import json
+import os
+import subprocess
+import tempfile
+import threading
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from loguru import logger
+
+from dagify.constants import MAVEN_REPOSITORY, SPARK_JARS_PACKAGES, value_error_msg
+from dagify.secrets_bundle import get_secrets_bundle
+
+COURSIER = os.environ.get("DAGIFY_COURSIER", "cs")
+
+_bundles: Dict[str, List[str]] = {}
+_bundles_lock = threading.Lock()
+
+
+def fetch(coordinates: List[str], repositories: List[str], cache_dir: str) -> List[Path]:
+    """
+    Resolves maven coordinates with coursier and downloads the jars into `cache_dir`.
+    Coursier applies exclusions, version ranges, classifiers and verifies checksums.
+    """
+    command = [COURSIER, "fetch", "--no-default", "--cache", cache_dir]
+    for repository in repositories:
+        command += ["--repository", repository]
+    result = subprocess.run(command + coordinates, check=True, capture_output=True, text=True)
+    return [Path(line) for line in result.stdout.splitlines() if line.strip()]
+
+
+class DependencyBundle:
+    """
+    Maven packages resolved once and published as jars, so drivers do not run Ivy on every start.
+    The bundle is keyed by a hash of the coordinates and repositories and stored either in S3 (s3a:// jars)
+    or on a shared PVC mounted into the spark pods (local:// jars).
+    It is published once by `publish`, from CI or a deploy job with coursier installed:
+        python -m dagify.dependencies --bucket spark-deps <SparkJobConf.packages>
+    Tasks only read the manifest with `get_jars`, nothing is resolved when a SparkApplication is rendered.
+    The manifest is read by airflow workers: with storage='pvc' it is kept in S3 if `bucket` is set,
+    otherwise the PVC must be mounted at `mount_path` in the workers as well.
+    Args:
+        bucket (str): S3 bucket for storage='s3', or for manifests of storage='pvc'
+        prefix (str): S3 prefix or directory on the PVC
+        storage (str): s3 or pvc
+        claim_name (str): PVC name for storage='pvc'
+        mount_path (str): where the PVC is mounted in the spark pods and in the publishing job
+        repositories (List[str]): maven repositories in addition to maven central,
+            must include K8sConf.repositories of the jobs using the bundle
+    """
+    STORAGES = ("s3", "pvc")
+
+    def __init__(self,
+                 bucket: Optional[str] = None,
+                 prefix: str = "spark-jars",
+                 storage: str = "s3",
+                 claim_name: Optional[str] = None,
+                 mount_path: str = "/opt/spark-jars",
+                 repositories: Optional[List[str]] = None):
+        if storage not in self.STORAGES:
+            raise ValueError(value_error_msg.format('storage', f"Use one of {self.STORAGES}"))
+        if storage == "s3" and not bucket:
+            raise ValueError(value_error_msg.format('bucket', "It is required for storage='s3'"))
+        if storage == "pvc" and not claim_name:
+            raise ValueError(value_error_msg.format('claim_name', "It is required for storage='pvc'"))
+        self.bucket = bucket
+        self.prefix = prefix.strip("/")
+        self.storage = storage
+        self.claim_name = claim_name
+        self.mount_path = mount_path
+        self.repositories = [MAVEN_REPOSITORY] + [r for r in repositories or [] if r != MAVEN_REPOSITORY]
+
+    def get_hash(self, coordinates: Iterable[str]) -> str:
+        key = ",".join(sorted(set(coordinates))) + "|" + ",".join(self.repositories)
+        return hashlib.sha256(key.encode()).hexdigest()[:16]
+
+    def get_jars(self, coordinates: Iterable[str]) -> List[str]:
+        """Returns jar urls of the published bundle, raises ValueError if it is not published"""
+        coordinates = sorted(set(coordinates))
+        bundle_hash = self.get_hash(coordinates)
+        with _bundles_lock:
+            if bundle_hash in _bundles:
+                return _bundles[bundle_hash]
+        jars = self._load_manifest(bundle_hash)
+        if jars is None:
+            raise ValueError(
+                f"Dependency bundle {bundle_hash} of {coordinates} is not published, "
+                f"publish it with `python -m dagify.dependencies`"
+            )
+        with _bundles_lock:
+            _bundles[bundle_hash] = jars
+        return jars
+
+    def publish(self, coordinates: Iterable[str]) -> List[str]:
+        """
+        Resolves the coordinates with coursier and uploads the jars, the manifest is written last,
+        so readers never see a partial bundle. Jar names are content addressed, concurrent publishers
+        of one bundle write the same objects and the last manifest wins.
+        """
+        coordinates = sorted(set(coordinates))
+        bundle_hash = self.get_hash(coordinates)
+        with tempfile.TemporaryDirectory() as cache_dir:
+            jars = []
+            for path in fetch(coordinates, self.repositories, cache_dir):
+                content = path.read_bytes()
+                digest = hashlib.sha256(content).hexdigest()[:12]
+                jars.append(self._put(f"{self.prefix}/{bundle_hash}/{digest}-{path.name}", content))
+        manifest = {"jars": jars, "coordinates": coordinates, "repositories": self.repositories}
+        self._put(f"{self.prefix}/{bundle_hash}/bundle.json", json.dumps(manifest).encode(),
+                  storage="s3" if self.bucket else self.storage)
+        logger.info(f"Published dependency bundle {bundle_hash} with {len(jars)} jars")
+        return jars
+
+    def volume(self) -> Optional[Tuple[Dict, Dict]]:
+        """(volume, volumeMount) of the PVC for storage='pvc'"""
+        if self.storage != "pvc":
+            return None
+        return ({'name': 'spark-jars', 'persistentVolumeClaim': {'claimName': self.claim_name, 'readOnly': True}},
+                {'name': 'spark-jars', 'mountPath': self.mount_path})
+
+    def _s3(self):
+        from dagify.utils import get_s3_client
+
+        secrets = get_secrets_bundle(("S3_ENDPOINT", "aws_access_key_id", "aws_secret_access_key"))
+        return get_s3_client(secrets["S3_ENDPOINT"], secrets["aws_access_key_id"], secrets["aws_secret_access_key"])
+
+    def _load_manifest(self, bundle_hash: str) -> Optional[List[str]]:
+        key = f"{self.prefix}/{bundle_hash}/bundle.json"
+        if self.bucket:
+            from botocore.exceptions import ClientError
+
+            try:
+                content = self._s3().get_object(Bucket=self.bucket, Key=key)["Body"].read()
+            except ClientError as e:
+                if e.response["Error"]["Code"] in ("NoSuchKey", "404"):
+                    return None
+                raise
+        else:
+            if not Path(self.mount_path).is_dir():
+                raise ValueError(
+                    f"PVC {self.claim_name} of the dependency bundle is not mounted at {self.mount_path}, "
+                    f"mount it into airflow workers or set bucket to keep bundle manifests in S3"
+                )
+            try:
+                content = (Path(self.mount_path) / key).read_bytes()
+            except FileNotFoundError:
+                return None
+        return json.loads(content)["jars"]
+
+    def _put(self, key: str, content: bytes, storage: Optional[str] = None) -> str:
+        if (storage or self.storage) == "s3":
+            self._s3().put_object(Bucket=self.bucket, Key=key, Body=content)
+            return f"s3a://{self.bucket}/{key}"
+        path = Path(self.mount_path) / key
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_suffix(f"{path.suffix}.{os.getpid()}.tmp")
+        tmp_path.write_bytes(content)
+        tmp_path.replace(path)
+        return f"local://{path}"
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Resolves maven packages and publishes a dependency bundle")
+    parser.add_argument("coordinates", nargs="*",
+                        help="SparkJobConf.packages of the job (group:artifact:version), "
+                             "SPARK_JARS_PACKAGES are always added")
+    parser.add_argument("--bucket")
+    parser.add_argument("--prefix", default="spark-jars")
+    parser.add_argument("--storage", choices=DependencyBundle.STORAGES, default="s3")
+    parser.add_argument("--claim-name")
+    parser.add_argument("--mount-path", default="/opt/spark-jars")
+    parser.add_argument("--repository", action="append", default=[], dest="repositories")
+    args = parser.parse_args()
+
+    bundle = DependencyBundle(bucket=args.bucket, prefix=args.prefix, storage=args.storage,
+                              claim_name=args.claim_name, mount_path=args.mount_path,
+                              repositories=args.repositories)
+    bundle.publish(list(dict.fromkeys(SPARK_JARS_PACKAGES + args.coordinates)))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,19 @@
-from typing import Any
+import socket
+import threading
+import time
+from typing import Any, Dict, Tuple
 
 from airflow.providers.cncf.kubernetes.hooks.kubernetes import KubernetesHook
 from kubernetes import client
-from retry import retry
+from urllib3.connection import HTTPConnection
+
+from dagify.constants import K8S_DEFAULT_CONF, API_CLIENT_POOL_MAXSIZE, API_CLIENT_TTL_SECONDS
+from dagify.informer import get_informer
+from dagify.resilience import RetryPolicy, resilient
+
+# (conn_id, in_cluster, config_file, cluster_context) -> (created_at, api client)
+_clients: Dict[Tuple[Any, ...], Tuple[float, client.ApiClient]] = {}
+_clients_lock = threading.Lock()
 
 
 class CustomKubernetesHook(KubernetesHook):
@@ -10,17 +21,95 @@ class CustomKubernetesHook(KubernetesHook):
     KubernetesHook with retries to avoid some yandex cloud strange behavior.
     Sometimes yc can not load k8s creds the first time.
     In case of airflow on k8s there's a chance it can be solved without any efforts
-    because airflow tries to load k8s cluster settings/context
+    because airflow tries to load k8s cluster settings/context.
+    Every call uses exponential backoff with jitter, and new SparkApplications are not submitted
+    while the circuit breaker of the cluster is open.
+    With use_informer=True SparkApplications are read from the watch cache of the process
+    instead of a GET request per call. It pays off only in long-lived processes polling many applications,
+    a task polling one application is cheaper with plain GETs than with its own namespace list+watch.
+    ApiClient is shared by all hooks of the process with the same connection, so TCP/TLS connections
+    are reused; it is recreated after API_CLIENT_TTL_SECONDS or on HTTP 401 to pick up fresh credentials.
+    API objects of the parent hook are built on every access, so they never hold a dropped client
     """
 
-    @retry(tries=3, delay=2)
+    def __init__(self, *args, use_informer: bool = False, retry_policy: RetryPolicy = None, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.use_informer = use_informer
+        self.retry_policy = retry_policy if retry_policy else RetryPolicy()
+
+    def _client_key(self) -> Tuple[Any, ...]:
+        return (self.conn_id,
+                getattr(self, "in_cluster", None),
+                getattr(self, "config_file", None),
+                getattr(self, "cluster_context", None))
+
     def get_conn(self) -> Any:
-        return super().get_conn()
+        key = self._client_key()
+        with _clients_lock:
+            cached = _clients.get(key)
+        if cached is not None and time.monotonic() - cached[0] < API_CLIENT_TTL_SECONDS:
+            return cached[1]
+        api_client = self._create_conn()
+        with _clients_lock:
+            _clients[key] = (time.monotonic(), api_client)
+        return api_client
 
-    @retry(tries=3, delay=2)
+    def invalidate_conn(self) -> None:
+        with _clients_lock:
+            _clients.pop(self._client_key(), None)
+
+    @resilient()
+    def _create_conn(self) -> client.ApiClient:
+        configuration = super().get_conn().configuration
+        configuration.connection_pool_maxsize = API_CLIENT_POOL_MAXSIZE
+        configuration.socket_options = HTTPConnection.default_socket_options + [
+            (socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+        ]
+        return client.ApiClient(configuration=configuration)
+
+    @resilient()
     def get_custom_object(self, *args, **kwargs):
+        if self.use_informer and kwargs.get("plural") == K8S_DEFAULT_CONF['plural']:
+            informer = get_informer(self.conn_id, self.api_client, kwargs["namespace"])
+            response = informer.get(kwargs["name"])
+            if response is not None:
+                return response
         return super().get_custom_object(*args, **kwargs)
 
+    @resilient(submission=True)
+    def create_custom_object(self, *args, **kwargs):
+        return super().create_custom_object(*args, **kwargs)
+
+    @resilient()
+    def delete_custom_object(self, *args, **kwargs):
+        return super().delete_custom_object(*args, **kwargs)
+
+    @resilient()
+    def get_pod_log_stream(self, *args, **kwargs):
+        return super().get_pod_log_stream(*args, **kwargs)
+
+    @resilient()
+    def get_pod_logs(self, *args, **kwargs):
+        return super().get_pod_logs(*args, **kwargs)
+
+    @resilient()
+    def list_custom_objects(self, group: str, version: str, plural: str, namespace: str, label_selector: str = "") -> Any:
+        return client.CustomObjectsApi(self.api_client).list_namespaced_custom_object(
+            group=group, version=version, plural=plural, namespace=namespace, label_selector=label_selector
+        )
+
+    @resilient()
+    def read_pod_log(self, **kwargs) -> str:
+        return client.CoreV1Api(self.api_client).read_namespaced_pod_log(**kwargs)
+
     @property
     def api_client(self) -> client.ApiClient:
         return self.get_conn()
+
+    @property
+    def custom_object_client(self) -> client.CustomObjectsApi:
+        return client.CustomObjectsApi(api_client=self.api_client)
+
+    @property
+    def core_v1_client(self) -> client.CoreV1Api:
+        return client.CoreV1Api(api_client=self.api_client)
@@ -0,0 +1,133 @@
+import threading
+import time
+from typing import Any, Dict, Optional, Tuple
+
+from kubernetes import client, watch
+from kubernetes.client.rest import ApiException
+from loguru import logger
+
+from dagify.constants import K8S_DEFAULT_CONF
+
+_informers: Dict[Tuple[str, str], "SparkApplicationInformer"] = {}
+_informers_lock = threading.Lock()
+
+
+class SparkApplicationInformer:
+    """
+    Process-wide cache of SparkApplication objects in one namespace.
+    Runs a single list+watch on the sparkapplications plural in a daemon thread
+    and resumes the watch from the last seen resourceVersion.
+    Airflow runs every task in its own process, so the cache is shared only by hooks
+    of the same process (e.g. SparkKubernetesBatchOperator threads), not between tasks.
+    Until the first list succeeds get() returns None, and callers fall back to a direct GET.
+    If that first list fails, get() returns None right away instead of waiting.
+    The cache is considered stale when nothing was heard from the api server (list, watch event, bookmark
+    or a watch request ending) for `max_staleness` seconds, e.g. a hung watch, get() returns None then too.
+
+    Args:
+        api_client (client.ApiClient): kubernetes api client
+        namespace (str): namespace to watch
+        watch_timeout (int): server side timeout of one watch request in seconds
+        max_staleness (float): seconds without contact with the api server after which the cache is not used
+    """
+
+    def __init__(self, api_client: client.ApiClient, namespace: str, watch_timeout: int = 60,
+                 max_staleness: float = 120) -> None:
+        self.api = client.CustomObjectsApi(api_client)
+        self.namespace = namespace
+        self.watch_timeout = watch_timeout
+        self.max_staleness = max_staleness
+        self.last_contact = 0.0
+        self.resource_version: Optional[str] = None
+        self._objects: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        self._synced = threading.Event()
+        self._failed = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=f"spark-informer-{namespace}", daemon=True)
+        self._thread.start()
+
+    def _list(self) -> None:
+        response = self.api.list_namespaced_custom_object(
+            group=K8S_DEFAULT_CONF['api_group'],
+            version=K8S_DEFAULT_CONF['api_version'],
+            plural=K8S_DEFAULT_CONF['plural'],
+            namespace=self.namespace,
+        )
+        with self._lock:
+            self._objects = {item["metadata"]["name"]: item for item in response.get("items", [])}
+        self.resource_version = response["metadata"]["resourceVersion"]
+        self.last_contact = time.monotonic()
+        self._synced.set()
+
+    def _watch(self) -> None:
+        stream = watch.Watch().stream(
+            self.api.list_namespaced_custom_object,
+            group=K8S_DEFAULT_CONF['api_group'],
+            version=K8S_DEFAULT_CONF['api_version'],
+            plural=K8S_DEFAULT_CONF['plural'],
+            namespace=self.namespace,
+            resource_version=self.resource_version,
+            timeout_seconds=self.watch_timeout,
+            allow_watch_bookmarks=True,
+            # client side timeout breaks a watch connection that hangs without events
+            _request_timeout=self.watch_timeout + 30,
+        )
+        for event in stream:
+            obj = event["object"]
+            self.last_contact = time.monotonic()
+            if event["type"] == "ERROR":
+                # 410 Gone: resourceVersion is too old, a full relist is required
+                if obj.get("code") == 410:
+                    self.resource_version = None
+                return
+            if event["type"] == "BOOKMARK":
+                self.resource_version = obj["metadata"]["resourceVersion"]
+                continue
+            name = obj["metadata"]["name"]
+            with self._lock:
+                if event["type"] == "DELETED":
+                    self._objects.pop(name, None)
+                else:
+                    self._objects[name] = obj
+            self.resource_version = obj["metadata"].get("resourceVersion", self.resource_version)
+        self.last_contact = time.monotonic()
+
+    def _run(self) -> None:
+        while True:
+            try:
+                if self.resource_version is None:
+                    self._list()
+                self._watch()
+            except ApiException as e:
+                if e.status == 410:
+                    self.resource_version = None
+                else:
+                    logger.warning(f"SparkApplication watch in {self.namespace} failed: {e.reason}")
+                    self._failed.set()
+                    time.sleep(5)
+            except Exception as e:
+                logger.warning(f"SparkApplication watch in {self.namespace} failed: {e}")
+                self._failed.set()
+                time.sleep(5)
+
+    def get(self, name: str, timeout: float = 10) -> Optional[Dict[str, Any]]:
+        """Returns the cached SparkApplication or None if it has not been observed yet or the cache is stale"""
+        if not self._synced.is_set():
+            if self._failed.is_set() or not self._synced.wait(timeout):
+                # do not block every poll on a watch that can not sync
+                self._failed.set()
+                return None
+        if time.monotonic() - self.last_contact > self.max_staleness:
+            logger.warning(f"SparkApplication watch in {self.namespace} is stale, reading from the api server")
+            return None
+        with self._lock:
+            return self._objects.get(name)
+
+
+def get_informer(conn_id: str, api_client: client.ApiClient, namespace: str) -> SparkApplicationInformer:
+    """Returns the shared informer for (conn_id, namespace), starting it on first use"""
+    key = (conn_id, namespace)
+    with _informers_lock:
+        if key not in _informers:
+            _informers[key] = SparkApplicationInformer(api_client, namespace)
+        return _informers[key]
@@ -0,0 +1,80 @@
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from airflow.stats import Stats
+
+METRIC_PREFIX = "dagify.spark"
+
+
+class SparkRunTimeline:
+    """
+    Timeline of one SparkApplication run: durations of the operator steps (render, nexus lookup, submit),
+    application state transitions and the number of polls. Emitted through airflow Stats with `tags`
+    (dag_id, task_id), so the metrics can be split per task.
+    """
+
+    def __init__(self, tags: Optional[Dict[str, str]] = None) -> None:
+        self.tags = tags or {}
+        self.events: List[Tuple[str, float]] = []
+        self.durations: Dict[str, float] = {}
+        self.polls = 0
+        self.state: Optional[str] = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Serializable state, carried over to execute_complete when the task is deferred"""
+        return {"events": self.events, "durations": self.durations, "polls": self.polls, "state": self.state}
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any], tags: Optional[Dict[str, str]] = None) -> "SparkRunTimeline":
+        timeline = cls(tags)
+        timeline.events = [tuple(event) for event in data["events"]]
+        timeline.durations = dict(data["durations"])
+        timeline.polls = data["polls"]
+        timeline.state = data["state"]
+        return timeline
+
+    def mark(self, event: str) -> None:
+        self.events.append((event, time.time()))
+
+    @contextmanager
+    def measure(self, step: str) -> Iterator[None]:
+        start = time.monotonic()
+        self.mark(f"{step}_started")
+        try:
+            yield
+        finally:
+            self.durations[step] = time.monotonic() - start
+            self.mark(f"{step}_finished")
+            Stats.timing(f"{METRIC_PREFIX}.{step}", self.durations[step] * 1000, tags=self.tags)
+
+    def observe_state(self, state: Optional[str]) -> None:
+        self.polls += 1
+        if state != self.state:
+            self.mark(f"state:{state}")
+            self.state = state
+
+    def get_state_durations(self) -> Dict[str, float]:
+        """Seconds spent in every application state, the current state is counted until now"""
+        state_events = [(event[len("state:"):], ts) for event, ts in self.events if event.startswith("state:")]
+        durations: Dict[str, float] = {}
+        for (state, start), (_, end) in zip(state_events, state_events[1:] + [("", time.time())]):
+            durations[state] = durations.get(state, 0) + end - start
+        return durations
+
+    def finish(self, queued_seconds: Optional[float] = None) -> Dict[str, Any]:
+        """Emits state metrics and returns the summary for XCom"""
+        state_durations = self.get_state_durations()
+        for state, seconds in state_durations.items():
+            Stats.timing(f"{METRIC_PREFIX}.state.{state.lower()}", seconds * 1000, tags=self.tags)
+        Stats.incr(f"{METRIC_PREFIX}.polls", self.polls, tags=self.tags)
+        if queued_seconds is not None:
+            Stats.timing(f"{METRIC_PREFIX}.queued", queued_seconds * 1000, tags=self.tags)
+        return {
+            "queued_seconds": queued_seconds,
+            "durations": self.durations,
+            "state_durations": state_durations,
+            "polls": self.polls,
+            "final_state": self.state,
+            "timeline": self.events,
+        }
@@ -1,41 +1,181 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
 import requests
-from packaging.version import Version
+from loguru import logger
+from packaging.version import InvalidVersion, Version
 from airflow.models import Variable
 
-from dagify.constants import params
+from dagify.constants import params, NEXUS_CACHE_TTL_SECONDS
+from dagify.utils import CONFIG_CACHE_DIR
+
+NEXUS_SEARCH_URL = ""
+
+_session = requests.Session()
+
+# (image, pin_digest) -> (expires_at, path), also kept on disk in CONFIG_CACHE_DIR/nexus
+_cache: Dict[Tuple[str, bool], Tuple[float, str]] = {}
+_cache_lock = threading.Lock()
+
+
+def _version_key(version: str) -> Version:
+    try:
+        return Version(version)
+    except InvalidVersion:
+        return Version('0.0')
+
+
+def _item_version(item: Dict) -> str:
+    return item['version'] if item['version'][0].isdigit() else '0.0'
+
+
+def get_latest_item(items: List[Dict]) -> Optional[Dict]:
+    if not items:
+        return None
+    return max(items, key=lambda item: _version_key(_item_version(item)))
 
-def get_latest_tag(items: str):
-    versions = [item['version'] if item['version'][0].isdigit() else '0.0' for item in items]
-    versions.sort(key=Version)
-    return versions[-1]
 
+def get_latest_tag(items: List[Dict]) -> str:
+    item = get_latest_item(items)
+    return _item_version(item) if item else '0.0'
 
-def get_nexus_path(image):
 
+def get_item_digest(item: Dict) -> Optional[str]:
+    """sha256 of the manifest asset of a Nexus search item, which is the image digest"""
+    for asset in item.get('assets', []):
+        if '/manifests/' in asset.get('path', '') and asset.get('checksum', {}).get('sha256'):
+            return f"sha256:{asset['checksum']['sha256']}"
+    return None
+
+
+def find_item(items: List[Dict], version: str) -> Optional[Dict]:
+    return next((item for item in items if item['version'] == version), None)
+
+
+def search_versions(service_name: str) -> List[Dict]:
+    """Returns all search items of the image, following Nexus continuationToken pagination"""
+    verify = Variable.get("ROOT_SERT_PATH")
+    request_params = {
+        "repository": "docker-private",
+        "name": service_name,
+        "sort": "version"
+    }
+    items = []
+    continuation_token: Optional[str] = None
+    while True:
+        if continuation_token:
+            request_params["continuationToken"] = continuation_token
+        response = _session.get(NEXUS_SEARCH_URL,
+                                params=request_params,
+                                timeout=60,
+                                verify=verify)
+        response.raise_for_status()
+        page = response.json()
+        items.extend(page['items'])
+        continuation_token = page.get('continuationToken')
+        if not continuation_token:
+            return items
+
+
+def resolve_nexus_path(image: str, pin_digest: bool = False) -> str:
     """
-    Used to get a path to IMAGE in Nexus.
+    Digests are the sha256 checksums of manifest assets in Nexus search results,
+    so they are read with the search credentials, an image whose tag is not found in Nexus is not pinned
     """
-
-    if ':' not in image:
+    if ':' in image:
+        if not pin_digest or '@' in image:
+            return image
+        path = image
+        service_name, _, version = image.partition('/')[2].rpartition(':')
+        item = find_item(search_versions(service_name), version)
+    else:
         service_name = image.split('/')[1]
-
         if params.env_type == 'dev':
             version = 'develop'
+            item = find_item(search_versions(service_name), version) if pin_digest else None
         else:
-            request_params = {
-                "repository": "docker-private",
-                "name": service_name,
-                "sort": "version"
-            }
-
-            response = requests.get("",
-                                    params=request_params,
-                                    timeout=60,
-                                    verify=Variable.get("ROOT_SERT_PATH"))
-
-            version = get_latest_tag(response.json()['items'])
+            item = get_latest_item(search_versions(service_name))
+            version = _item_version(item) if item else '0.0'
             if version == '0.0':
                 raise ValueError(
                     'There is no tag in the repository. Make sure that the image deploy with the tag is made correctly.')
-        image = f'{image.split("/")[0]}/{service_name}:{version}'
-    return image
+        path = f'{image.split("/")[0]}/{service_name}:{version}'
+    if not pin_digest:
+        return path
+    digest = get_item_digest(item) if item else None
+    if digest is None:
+        logger.warning(f"There is no manifest checksum of {path} in Nexus, the tag is used")
+        return path
+    return f'{path}@{digest}'
+
+
+def _disk_cache_path(image: str, pin_digest: bool) -> Path:
+    key = f"{params.env_type}|{image}|{pin_digest}"
+    return CONFIG_CACHE_DIR / "nexus" / (hashlib.sha256(key.encode()).hexdigest() + ".json")
+
+
+def _read_disk_cache(image: str, pin_digest: bool) -> Optional[Tuple[float, str]]:
+    try:
+        entry = json.loads(_disk_cache_path(image, pin_digest).read_text())
+        return entry["expires_at"], entry["path"]
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+def _write_disk_cache(image: str, pin_digest: bool, expires_at: float, path: str) -> None:
+    cache_path = _disk_cache_path(image, pin_digest)
+    try:
+        cache_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = cache_path.with_suffix(f".{os.getpid()}.tmp")
+        tmp_path.write_text(json.dumps({"expires_at": expires_at, "path": path}))
+        tmp_path.replace(cache_path)
+    except OSError as e:
+        logger.warning(f"Can not write nexus cache to {CONFIG_CACHE_DIR}: {e}")
+
+
+def get_nexus_path(image: str, ttl: float = NEXUS_CACHE_TTL_SECONDS, pin_digest: bool = False) -> str:
+
+    """
+    Used to get a path to IMAGE in Nexus.
+    With pin_digest=True the tag is resolved to an immutable digest: registry/name:tag@sha256:...
+    Resolved images are cached for `ttl` seconds in memory and on disk in CONFIG_CACHE_DIR,
+    so the tasks running on one worker share lookups, like DAG parse processes share merged configs.
+    """
+
+    if ':' in image and not pin_digest:
+        return image
+
+    now = time.time()
+    with _cache_lock:
+        cached = _cache.get((image, pin_digest))
+    if cached is None:
+        cached = _read_disk_cache(image, pin_digest)
+        if cached is not None:
+            with _cache_lock:
+                _cache[(image, pin_digest)] = cached
+    if cached is not None and cached[0] > now:
+        return cached[1]
+
+    path = resolve_nexus_path(image, pin_digest)
+    with _cache_lock:
+        _cache[(image, pin_digest)] = (now + ttl, path)
+    _write_disk_cache(image, pin_digest, now + ttl, path)
+    return path
+
+
+def get_nexus_paths(images: Iterable[str], max_workers: int = 8, pin_digest: bool = False) -> Dict[str, str]:
+    """
+    Resolves all distinct images concurrently and warms the cache.
+    Used by SparkKubernetesBatchOperator before its variants are rendered.
+    Returns a mapping image -> path in Nexus.
+    """
+    distinct_images = list(dict.fromkeys(images))
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        paths = list(executor.map(lambda image: get_nexus_path(image, pin_digest=pin_digest), distinct_images))
+    return dict(zip(distinct_images, paths))
@@ -0,0 +1,185 @@
+import atexit
+import queue
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import Dict, List, Optional, Tuple
+
+import requests
+from loguru import logger
+from requests.adapters import HTTPAdapter
+
+TELEGRAM_API_URL = "https://api.telegram.org"
+TELEGRAM_MESSAGE_LIMIT = 4096
+
+_notifiers: Dict[Tuple[str, str], "TelegramNotifier"] = {}
+_notifiers_lock = threading.Lock()
+
+
+class TokenBucket:
+    """
+    Token bucket rate limiter.
+    Args:
+        rate (float): tokens added per second
+        capacity (int): maximum burst size
+    """
+
+    def __init__(self, rate: float, capacity: int) -> None:
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self.lock = threading.Lock()
+
+    def acquire(self) -> None:
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if now >= self.blocked_until and self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait_seconds = max(self.blocked_until - now, (1 - self.tokens) / self.rate)
+            time.sleep(wait_seconds)
+
+    def block(self, seconds: float) -> None:
+        """Stops handing out tokens for `seconds`, e.g. on HTTP 429 retry_after"""
+        with self.lock:
+            self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+
+
+class TelegramNotifier:
+    """
+    Sends telegram messages in the background so callbacks never block on the Telegram API.
+    Messages queued within `digest_window` seconds are coalesced into one digest per chat,
+    chats are served in parallel through a pooled session and a shared rate limiter.
+    flush() cuts the digest window short, so a waiting caller is not held for the window.
+    Args:
+        token (str): telegram bot token
+        base_url (str): telegram api url
+        timeout (float): http timeout in seconds
+        max_retries (int): retries of one message on errors and HTTP 429
+        rate (float): messages per second
+        burst (int): maximum burst of messages
+        digest_window (float): seconds to collect messages before sending
+        max_workers (int): parallel requests
+    """
+
+    def __init__(
+        self,
+        token: str,
+        base_url: str = TELEGRAM_API_URL,
+        timeout: float = 10,
+        max_retries: int = 3,
+        rate: float = 25,
+        burst: int = 25,
+        digest_window: float = 2,
+        max_workers: int = 8,
+    ) -> None:
+        self.url = f"{base_url}/bot{token}/sendMessage"
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.digest_window = digest_window
+        self.bucket = TokenBucket(rate, burst)
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=max_workers, pool_maxsize=max_workers)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+        # None is put by flush() to send the collected messages without waiting for the digest window
+        self.queue: "queue.Queue[Optional[Tuple[str, str]]]" = queue.Queue()
+        self.worker = threading.Thread(target=self._run, name="telegram-notifier", daemon=True)
+        self.worker.start()
+        atexit.register(self.flush)
+
+    def send(self, text: str, chat_ids: List[str]) -> None:
+        for chat_id in chat_ids:
+            self.queue.put((chat_id, text))
+
+    def flush(self, timeout: Optional[float] = 30) -> None:
+        """Sends queued messages right away and waits until every one is sent or given up"""
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        if self.queue.unfinished_tasks:
+            self.queue.put(None)
+        while self.queue.unfinished_tasks:
+            if deadline is not None and time.monotonic() > deadline:
+                logger.warning(f"{self.queue.unfinished_tasks} telegram messages were not sent")
+                return
+            time.sleep(0.05)
+
+    @staticmethod
+    def digest(texts: List[str]) -> str:
+        if len(texts) == 1:
+            return texts[0]
+        text = f"{len(texts)} notifications:\n\n" + "\n\n".join(texts)
+        return text[:TELEGRAM_MESSAGE_LIMIT]
+
+    def _run(self) -> None:
+        while True:
+            items = [self.queue.get()]
+            deadline = time.monotonic() + self.digest_window
+            while items[-1] is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    items.append(self.queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            if items[-1] is None:
+                # flushing: take what is already queued without waiting
+                while True:
+                    try:
+                        items.append(self.queue.get_nowait())
+                    except queue.Empty:
+                        break
+
+            by_chat: "OrderedDict[str, List[str]]" = OrderedDict()
+            for item in items:
+                if item is not None:
+                    by_chat.setdefault(item[0], []).append(item[1])
+            futures = [self.executor.submit(self.post, chat_id, self.digest(texts))
+                       for chat_id, texts in by_chat.items()]
+            wait(futures)
+            for _ in items:
+                self.queue.task_done()
+
+    def post(self, chat_id: str, text: str) -> bool:
+        payload = {
+            "text": text,
+            "parse_mode": "None",
+            "disable_web_page_preview": False,
+            "disable_notification": False,
+            "reply_to_message_id": None,
+            "chat_id": chat_id,
+        }
+        headers = {"accept": "application/json", "content-type": "application/json"}
+        for attempt in range(self.max_retries + 1):
+            self.bucket.acquire()
+            try:
+                response = self.session.post(self.url, json=payload, headers=headers, timeout=self.timeout)
+            except requests.RequestException as e:
+                logger.warning(f"telegram request failed: {e}")
+                time.sleep(min(2 ** attempt, 30))
+                continue
+            if response.status_code == 429:
+                retry_after = response.json().get("parameters", {}).get("retry_after") \
+                    or response.headers.get("Retry-After", 1)
+                self.bucket.block(float(retry_after))
+                continue
+            logger.info(f"status code:{response.status_code}, cause: {response.text}")
+            return response.ok
+        logger.error(f"telegram message to {chat_id} was not sent after {self.max_retries} retries")
+        return False
+
+
+def get_telegram_notifier(token: str, base_url: str = TELEGRAM_API_URL) -> TelegramNotifier:
+    """Returns the notifier shared by the process for the bot token"""
+    key = (token, base_url)
+    with _notifiers_lock:
+        if key not in _notifiers:
+            _notifiers[key] = TelegramNotifier(token, base_url=base_url)
+        return _notifiers[key]
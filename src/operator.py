@@ -1,23 +1,47 @@
-from typing import Any, Dict, Optional, Sequence
+from typing import Any, Dict, List, Optional, Sequence
+import copy
+import hashlib
+import json
+import math
 import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from functools import cached_property
 
 from airflow.models import BaseOperator
 from airflow.utils.context import Context
-from airflow.providers.cncf.kubernetes.hooks.kubernetes import KubernetesHook
 from airflow.exceptions import AirflowException
+from airflow.triggers.temporal import TimeDeltaTrigger
+from kubernetes.client.rest import ApiException
 
-from dagify.configs import SparkJobConf, K8sConf, get_k8s_yaml_with_spark
+from dagify.admission import AdmissionController
+from dagify.hooks import CustomKubernetesHook
+from dagify.dag_utils import SPARK_APP_NAME_LABEL, wait_for_spark_applications_deleted
+from dagify.configs import SparkJobConf, K8sConf, get_k8s_body_with_spark
+from dagify.triggers import SparkApplicationTrigger, update_peak_usage
+from dagify.metrics import SparkRunTimeline
+from dagify.run_history import RunHistoryStore
+from dagify.nexus_path_extractor import get_nexus_path, get_nexus_paths
 from dagify.constants import \
     K8S_DEFAULT_CONF, \
     params,\
     FAILURE_STATES, \
     SUCCESS_STATES, \
-    PENDING_STATES
+    PENDING_STATES, \
+    SPARK_CONF_SECRET_SETTINGS, \
+    value_error_msg
+
+BATCH_LABEL = "dagify/batch"
+SPEC_HASH_ANNOTATION = "dagify/spec-hash"
+LOG_OVERLAP_SECONDS = 5
+USAGE_SAMPLE_INTERVAL_SECONDS = 30
 
 
 class SparkKubernetesOperator(BaseOperator):
     """SparkKubernetesOperator and CustomSparkKubernetesSensor are combined into one TaskGroup.
-    It was made to enable retries for the whole group and avoid boilerplate operator/sensor definitions"""
+    It was made to enable retries for the whole group and avoid boilerplate operator/sensor definitions.
+    With deferrable=True the application status is watched by SparkApplicationTrigger in the triggerer
+    and the worker slot is released right after submission"""
     template_fields: Sequence[str] = ("args", "envs", "name")
     def __init__(
             self,
@@ -26,6 +50,11 @@ class SparkKubernetesOperator(BaseOperator):
             k8s_conf: K8sConf = K8sConf(),
             kubernetes_conn_id: Optional[str] = 'kubernetes_default',
             task_id: str = None,
+            deferrable: bool = False,
+            poll_interval: float = 10,
+            log_max_bytes: int = 1024 * 1024,
+            record_history: bool = False,
+            admission: Optional[AdmissionController] = None,
             **kwargs
     ) -> None:
 
@@ -33,7 +62,18 @@ class SparkKubernetesOperator(BaseOperator):
         self.k8s_conf = k8s_conf
         self.spark_yaml = self.application_file = spark_yaml
         self.namespace = K8S_DEFAULT_CONF['namespace']
-        self.hook = KubernetesHook(conn_id=kubernetes_conn_id)
+        self.kubernetes_conn_id = kubernetes_conn_id
+        self.deferrable = deferrable
+        self.poll_interval = poll_interval
+        self.log_max_bytes = log_max_bytes
+        self.last_log_timestamp: Optional[str] = None
+        self.log_overlap_seconds = LOG_OVERLAP_SECONDS
+        self.admission = admission
+        self.record_history = record_history or bool(spark_conf and spark_conf.auto_size)
+        self.last_response: Optional[Dict[str, Any]] = None
+        self.peak_usage: Dict[str, float] = {}
+        self.last_usage_sample = 0.0
+        self.timeline = SparkRunTimeline()
 
         if self.spark_yaml:
             self.name = self.spark_yaml["metadata"]["name"]
@@ -45,6 +85,10 @@ class SparkKubernetesOperator(BaseOperator):
         self.name = "-".join(
             [self.name, params.env_type]
         )
+        if self.spark_yaml:
+            self.namespace = self.spark_yaml["metadata"].get("namespace", self.namespace)
+        elif self.k8s_conf and self.k8s_conf.namespace:
+            self.namespace = self.k8s_conf.namespace
         if self.spark_yaml:
             self.spark_yaml["metadata"]["name"] = self.name
             self.envs=spark_yaml.get('spec').get('env')
@@ -54,8 +98,14 @@ class SparkKubernetesOperator(BaseOperator):
         super().__init__(**{**kwargs, **{'task_id': task_id}})
 
 
-    def execute(self, context: Context):
+    @cached_property
+    def hook(self) -> CustomKubernetesHook:
+        """Created on first use so DAG parsing does not touch the kubernetes connection"""
+        return CustomKubernetesHook(conn_id=self.kubernetes_conn_id)
 
+    def execute(self, context: Context, event: Optional[Dict[str, Any]] = None):
+        """event is set when the task is resumed after waiting for admission"""
+        self.timeline = SparkRunTimeline(tags=self.get_metric_tags(context))
 
         if (self.spark_yaml is None and self.spark_conf is None) \
                 or (self.spark_yaml and self.spark_conf):
@@ -67,26 +117,170 @@ class SparkKubernetesOperator(BaseOperator):
             self.spark_conf.args = self.args
             self.spark_conf.name = self.name
 
-            self.namespace = self.k8s_conf.namespace if self.k8s_conf else self.namespace
-            spark_job_config = get_k8s_yaml_with_spark(self.spark_conf, self.k8s_conf, context)
+            self.namespace = self.k8s_conf.namespace if self.k8s_conf and self.k8s_conf.namespace else self.namespace
+            with self.timeline.measure("nexus_lookup"):
+                # warms the nexus cache, so render time below does not include the lookup
+                get_nexus_path(self.spark_conf.image, pin_digest=self.spark_conf.pin_image_digest)
+            with self.timeline.measure("render"):
+                spark_job_config = get_k8s_body_with_spark(self.spark_conf, self.k8s_conf, context)
 
             self.application_file = spark_job_config
 
-        self.log.info("Creating sparkApplication")
-        response = self.hook.create_custom_object(
-            group=K8S_DEFAULT_CONF['api_group'],
-            version=K8S_DEFAULT_CONF['api_version'],
-            plural=K8S_DEFAULT_CONF['plural'],
-            body=self.application_file,
-            namespace=self.namespace
-        )
+        spec_hash = self.get_spec_hash(self.application_file,
+                                       self.spark_conf.image if self.spark_conf else None,
+                                       context["run_id"])
+        self.application_file["metadata"].setdefault("annotations", {})[SPEC_HASH_ANNOTATION] = spec_hash
+        if self.reattach(spec_hash):
+            response = True
+        else:
+            if self.admission and not self.admission.admit(self.name, self.application_file, self.priority_weight):
+                # frees the worker slot, execute runs again after recheck_interval
+                self.defer(trigger=TimeDeltaTrigger(timedelta(seconds=self.admission.recheck_interval)),
+                           method_name="execute")
+            self.log.info("Creating sparkApplication")
+            with self.timeline.measure("submit"):
+                response = self.hook.create_custom_object(
+                    group=K8S_DEFAULT_CONF['api_group'],
+                    version=K8S_DEFAULT_CONF['api_version'],
+                    plural=K8S_DEFAULT_CONF['plural'],
+                    body=self.application_file,
+                    namespace=self.namespace
+                )
         if response:
-            return self.check_application_status()
+            if self.deferrable:
+                self.defer(
+                    trigger=SparkApplicationTrigger(
+                        name=self.name,
+                        namespace=self.namespace,
+                        kubernetes_conn_id=self.kubernetes_conn_id,
+                        poll_interval=self.poll_interval,
+                        sample_usage_interval=USAGE_SAMPLE_INTERVAL_SECONDS if self.record_history else None,
+                    ),
+                    method_name="execute_complete",
+                    kwargs={"timeline": self.timeline.to_dict()},
+                )
+            try:
+                return self.check_application_status()
+            finally:
+                if self.record_history and self.last_response:
+                    self.record_run(self.last_response, self.peak_usage)
+                self.push_timeline(context)
 
         # TODO Переделать, взависимости от содержания возвращаемого запроса
         else:
             raise AirflowException(f"Spark application failed: {response.text}")
 
+    @staticmethod
+    def get_spec_hash(body: Dict[str, Any], image: Optional[str], run_id: str) -> str:
+        """Hash of the fields set by the user and of the dag run.
+        image is the image as the user set it, before the Nexus lookup; the resolved tag or digest,
+        the pull policy derived from it and secret values are left out, so a new image build
+        or rotated secrets do not make a retry start a finished application again"""
+        spec = dict(body["spec"])
+        if image is not None:
+            spec["image"] = image
+            spec.pop("imagePullPolicy", None)
+        spec["sparkConf"] = {key: value for key, value in spec.get("sparkConf", {}).items()
+                             if key not in SPARK_CONF_SECRET_SETTINGS}
+        payload = json.dumps({"run_id": run_id, "spec": spec}, sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode()).hexdigest()[:32]
+
+    def reattach(self, spec_hash: str) -> bool:
+        """Handles a SparkApplication left by a previous try with the same name.
+        Returns True if the task should monitor the existing application: same spec and dag run, not failed.
+        A COMPLETED application of this run is never deleted, the task just succeeds.
+        A failed application or one of another spec or dag run is deleted, so it can be created again"""
+        try:
+            existing = self.hook.get_custom_object(
+                group=K8S_DEFAULT_CONF['api_group'],
+                version=K8S_DEFAULT_CONF['api_version'],
+                plural=K8S_DEFAULT_CONF['plural'],
+                name=self.name,
+                namespace=self.namespace,
+            )
+        except ApiException as e:
+            if e.status == 404:
+                return False
+            raise
+        existing_hash = existing["metadata"].get("annotations", {}).get(SPEC_HASH_ANNOTATION)
+        state = existing.get("status", {}).get("applicationState", {}).get("state")
+        if existing_hash == spec_hash and state not in FAILURE_STATES:
+            self.log.info("Reattaching to sparkApplication %s in state %s", self.name, state)
+            return True
+
+        self.log.info("Deleting sparkApplication %s left in state %s", self.name, state)
+        try:
+            self.hook.delete_custom_object(
+                group=K8S_DEFAULT_CONF['api_group'],
+                version=K8S_DEFAULT_CONF['api_version'],
+                plural=K8S_DEFAULT_CONF['plural'],
+                name=self.name,
+                namespace=self.namespace,
+            )
+        except ApiException as e:
+            if e.status != 404:
+                raise
+        wait_for_spark_applications_deleted([self.name], namespace=self.namespace,
+                                            kubernetes_conn_id=self.kubernetes_conn_id)
+        return False
+
+    def record_run(self, response: Dict[str, Any], peak_usage: Dict[str, float]) -> None:
+        duration = sum(self.timeline.get_state_durations().values())
+        RunHistoryStore().record_application(response, duration, peak_usage)
+
+    def push_timeline(self, context: Context) -> None:
+        ti = context["ti"]
+        queued_seconds = None
+        if getattr(ti, "queued_dttm", None) and getattr(ti, "start_date", None):
+            queued_seconds = (ti.start_date - ti.queued_dttm).total_seconds()
+        summary = self.timeline.finish(queued_seconds)
+        self.log.info("Spark application timeline: %s", summary["state_durations"])
+        ti.xcom_push(key="spark_timeline", value=summary)
+
+    @staticmethod
+    def get_metric_tags(context: Context) -> Dict[str, str]:
+        return {"dag_id": context["ti"].dag_id, "task_id": context["ti"].task_id}
+
+    def execute_complete(
+            self,
+            context: Context,
+            event: Dict[str, Any],
+            timeline: Optional[Dict[str, Any]] = None,
+    ) -> bool:
+        """timeline: steps measured before the task was deferred, the trigger adds the state transitions"""
+        if timeline is not None:
+            self.timeline = SparkRunTimeline.from_dict(timeline, tags=self.get_metric_tags(context))
+            trigger_timeline = event.get("timeline", {})
+            self.timeline.events.extend(tuple(item) for item in trigger_timeline.get("events", []))
+            self.timeline.polls += trigger_timeline.get("polls", 0)
+            self.timeline.state = event.get("state", self.timeline.state)
+        try:
+            if event["status"] == "success":
+                self.log.info("Spark application %s ended successfully", event["name"])
+                return True
+            if event["status"] == "failed":
+                raise AirflowException(f"Spark application failed with state: {event['state']}")
+            raise AirflowException(f"{event['name']} failed: {event.get('message')}")
+        finally:
+            if self.record_history:
+                self.record_deferred_run(event.get("peak_usage", {}))
+            self.push_timeline(context)
+
+    def record_deferred_run(self, peak_usage: Dict[str, float]) -> None:
+        """The trigger only reports states, the final application is read once to record it"""
+        try:
+            response = self.hook.get_custom_object(
+                group=K8S_DEFAULT_CONF['api_group'],
+                version=K8S_DEFAULT_CONF['api_version'],
+                plural=K8S_DEFAULT_CONF['plural'],
+                name=self.name,
+                namespace=self.namespace,
+            )
+        except Exception as e:
+            self.log.warning("Can not record run history of %s: %s", self.name, e)
+            return
+        self.record_run(response, peak_usage)
+
     def check_application_status(self, **kwargs):
         app_name = self.name
         while True:
@@ -108,10 +302,13 @@ class SparkKubernetesOperator(BaseOperator):
             name=self.name,
             namespace=self.namespace,
         )
+        self.last_response = response
         try:
             application_state = response["status"]["applicationState"]["state"]
         except KeyError:
+            self.timeline.observe_state(None)
             return False
+        self.timeline.observe_state(application_state)
         if application_state in FAILURE_STATES:
             raise AirflowException(f"Spark application failed with state: {application_state}")
         elif application_state in PENDING_STATES:
@@ -123,9 +320,54 @@ class SparkKubernetesOperator(BaseOperator):
         else:
             self.log.info("Spark application still is in state: %s", application_state)
             self.log_driver(response)
+            if self.record_history:
+                self.sample_peak_usage()
             return False
 
+    def sample_peak_usage(self) -> None:
+        """Keeps the highest memory usage of the driver and of one executor pod reported by metrics-server"""
+        if time.monotonic() - self.last_usage_sample < USAGE_SAMPLE_INTERVAL_SECONDS:
+            return
+        self.last_usage_sample = time.monotonic()
+        try:
+            response = self.hook.list_custom_objects(
+                group="metrics.k8s.io",
+                version="v1beta1",
+                plural="pods",
+                namespace=self.namespace,
+                label_selector=f"{SPARK_APP_NAME_LABEL}={self.name}",
+            )
+        except Exception as e:
+            # metrics-server is optional, without it memory is only ever raised after OOM
+            self.log.warning("Can not read pod metrics of %s: %s", self.name, e)
+            return
+        update_peak_usage(self.peak_usage, response["items"])
+
+    @staticmethod
+    def normalize_log_timestamp(timestamp: str) -> str:
+        """Pads RFC3339Nano fraction to 9 digits so timestamps are comparable as strings"""
+        date, _, fraction = timestamp.rstrip("Z").partition(".")
+        return f"{date}.{fraction:0<9}Z"
+
+    def get_log_since_seconds(self) -> Optional[int]:
+        if self.last_log_timestamp is None:
+            return None
+        last_log_time = datetime.strptime(self.last_log_timestamp[:19], "%Y-%m-%dT%H:%M:%S").replace(tzinfo=timezone.utc)
+        # a few seconds of overlap for clock skew, duplicates are dropped by timestamp
+        return max(1, math.ceil((datetime.now(timezone.utc) - last_log_time).total_seconds()) + self.log_overlap_seconds)
+
+    def emit_log_line(self, line: str, truncated: bool = False) -> bool:
+        """Logs a line written after the last logged one, returns False for lines already seen"""
+        timestamp, _, message = line.partition(" ")
+        timestamp = self.normalize_log_timestamp(timestamp)
+        if self.last_log_timestamp is not None and timestamp <= self.last_log_timestamp:
+            return False
+        self.last_log_timestamp = timestamp
+        self.log.info(message + " [truncated]" if truncated else message)
+        return True
+
     def log_driver(self, response: dict) -> None:
+        """Prints driver log lines written since the previous call, at most log_max_bytes per call"""
         status_info = response["status"]
         if "driverInfo" not in status_info:
             return
@@ -134,8 +376,228 @@ class SparkKubernetesOperator(BaseOperator):
             return
         driver_pod_name = driver_info["podName"]
         namespace = response["metadata"]["namespace"]
-        log = self.hook.get_pod_log_stream(pod_name=driver_pod_name,
-                                           container=K8S_DEFAULT_CONF['container_name'],
-                                           namespace=namespace)
-        for event in log[-1]:
-            self.log.info(f"{event}")
+        log = self.hook.read_pod_log(
+            name=driver_pod_name,
+            container=K8S_DEFAULT_CONF['container_name'],
+            namespace=namespace,
+            timestamps=True,
+            since_seconds=self.get_log_since_seconds(),
+            limit_bytes=self.log_max_bytes,
+        )
+        lines = log.splitlines()
+        truncated = len(log.encode()) >= self.log_max_bytes
+        # the last line may be cut by limit_bytes, it will be read on the next call
+        progress = False
+        for line in lines[:-1] if truncated else lines:
+            progress = self.emit_log_line(line) or progress
+        if not truncated or progress:
+            self.log_overlap_seconds = LOG_OVERLAP_SECONDS
+            return
+
+        # nothing new fits into log_max_bytes: either one line is longer than the limit
+        # or the overlap window alone is larger than the limit
+        if lines and self.emit_log_line(lines[-1], truncated=True):
+            return
+        if self.log_overlap_seconds:
+            self.log_overlap_seconds = 0
+            return
+        self.log.warning("Driver log of %s is written faster than log_max_bytes per poll, skipping to now", self.name)
+        self.last_log_timestamp = self.normalize_log_timestamp(
+            datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+        )
+
+
+class SparkKubernetesBatchOperator(BaseOperator):
+    """Submits many SparkApplications from one task and monitors them together.
+    Variants are rendered and submitted by a bounded thread pool, the states of all of them
+    are read with one label selector list call per poll_interval.
+    failure_policy: fail_fast - fail as soon as one application fails and delete the rest,
+    collect_all - wait for every application and fail at the end if any failed.
+    On a retry applications of the previous try with the same spec that did not fail are monitored again,
+    the rest are deleted and created again. If a submission fails, the applications submitted so far are deleted.
+    An application that disappears before reaching a terminal state (deleted, or removed by timeToLiveSeconds
+    between two polls) counts as failed with state UNKNOWN; one never listed counts so after MISSING_GRACE_SECONDS.
+    timeout: seconds to wait for all applications, the unfinished ones are deleted and the task fails.
+    Returns (and pushes to XCom) a mapping application name -> final state"""
+    FAILURE_POLICIES = ("fail_fast", "collect_all")
+    MISSING_GRACE_SECONDS = 60
+    MISSING_STATE = "UNKNOWN"
+
+    def __init__(
+            self,
+            spark_confs: List[SparkJobConf],
+            k8s_conf: K8sConf = K8sConf(),
+            kubernetes_conn_id: Optional[str] = 'kubernetes_default',
+            max_workers: int = 8,
+            poll_interval: float = 10,
+            failure_policy: str = "fail_fast",
+            timeout: Optional[float] = None,
+            **kwargs
+    ) -> None:
+        if failure_policy not in self.FAILURE_POLICIES:
+            raise ValueError(value_error_msg.format('failure_policy', f"Use one of {self.FAILURE_POLICIES}"))
+        names = [spark_conf.name for spark_conf in spark_confs]
+        duplicated = sorted({name for name in names if names.count(name) > 1})
+        if duplicated:
+            raise ValueError(value_error_msg.format('spark_confs', f"Names must be unique, duplicated: {duplicated}"))
+        super().__init__(**kwargs)
+        self.spark_confs = spark_confs
+        self.k8s_conf = k8s_conf
+        self.kubernetes_conn_id = kubernetes_conn_id
+        self.max_workers = max_workers
+        self.poll_interval = poll_interval
+        self.failure_policy = failure_policy
+        self.timeout = timeout
+        self.namespace = k8s_conf.namespace if k8s_conf and k8s_conf.namespace else K8S_DEFAULT_CONF['namespace']
+
+    @cached_property
+    def hook(self) -> CustomKubernetesHook:
+        return CustomKubernetesHook(conn_id=self.kubernetes_conn_id)
+
+    def create(self, body: Dict[str, Any]) -> None:
+        name = body['metadata']['name']
+        try:
+            self.hook.create_custom_object(
+                group=K8S_DEFAULT_CONF['api_group'],
+                version=K8S_DEFAULT_CONF['api_version'],
+                plural=K8S_DEFAULT_CONF['plural'],
+                body=body,
+                namespace=self.namespace
+            )
+        except ApiException as e:
+            if e.status != 409:
+                raise
+            # left by another dag run, it is not labeled with this batch id
+            self.log.info("Replacing sparkApplication %s of another run", name)
+            self.delete([name])
+            wait_for_spark_applications_deleted([name], namespace=self.namespace,
+                                                kubernetes_conn_id=self.kubernetes_conn_id)
+            self.hook.create_custom_object(
+                group=K8S_DEFAULT_CONF['api_group'],
+                version=K8S_DEFAULT_CONF['api_version'],
+                plural=K8S_DEFAULT_CONF['plural'],
+                body=body,
+                namespace=self.namespace
+            )
+        self.log.info("Created sparkApplication %s", name)
+
+    def submit(
+            self,
+            spark_conf: SparkJobConf,
+            batch_id: str,
+            context: Context,
+            existing: Dict[str, Dict[str, Any]],
+    ) -> str:
+        spark_conf = copy.copy(spark_conf)
+        spark_conf.name = "-".join([spark_conf.name, params.env_type])
+        body = get_k8s_body_with_spark(spark_conf, self.k8s_conf, context)
+        body['metadata'].setdefault('labels', {})[BATCH_LABEL] = batch_id
+        spec_hash = SparkKubernetesOperator.get_spec_hash(body, spark_conf.image, context["run_id"])
+        body['metadata'].setdefault('annotations', {})[SPEC_HASH_ANNOTATION] = spec_hash
+
+        previous = existing.get(spark_conf.name)
+        if previous is not None:
+            state = previous.get("status", {}).get("applicationState", {}).get("state")
+            if previous["metadata"].get("annotations", {}).get(SPEC_HASH_ANNOTATION) == spec_hash \
+                    and state not in FAILURE_STATES:
+                self.log.info("Reusing sparkApplication %s of the previous try in state %s", spark_conf.name, state)
+                return spark_conf.name
+            self.delete([spark_conf.name])
+            wait_for_spark_applications_deleted([spark_conf.name], namespace=self.namespace,
+                                                kubernetes_conn_id=self.kubernetes_conn_id)
+        self.create(body)
+        return spark_conf.name
+
+    def get_applications(self, batch_id: str) -> Dict[str, Dict[str, Any]]:
+        response = self.hook.list_custom_objects(
+            group=K8S_DEFAULT_CONF['api_group'],
+            version=K8S_DEFAULT_CONF['api_version'],
+            plural=K8S_DEFAULT_CONF['plural'],
+            namespace=self.namespace,
+            label_selector=f"{BATCH_LABEL}={batch_id}",
+        )
+        return {item["metadata"]["name"]: item for item in response["items"]}
+
+    def get_states(self, batch_id: str) -> Dict[str, Optional[str]]:
+        return {
+            name: item.get("status", {}).get("applicationState", {}).get("state")
+            for name, item in self.get_applications(batch_id).items()
+        }
+
+    def delete(self, names: List[str]) -> None:
+        for name in names:
+            self.log.info("Deleting sparkApplication %s", name)
+            try:
+                self.hook.delete_custom_object(
+                    group=K8S_DEFAULT_CONF['api_group'],
+                    version=K8S_DEFAULT_CONF['api_version'],
+                    plural=K8S_DEFAULT_CONF['plural'],
+                    name=name,
+                    namespace=self.namespace,
+                )
+            except ApiException as e:
+                if e.status != 404:
+                    raise
+
+    def execute(self, context: Context) -> Dict[str, Optional[str]]:
+        ti = context["ti"]
+        batch_id = hashlib.sha1(f"{ti.dag_id}.{ti.task_id}.{ti.run_id}".encode()).hexdigest()[:16]
+        # distinct images are looked up once, the submit threads then read them from the cache
+        for pin_digest in {spark_conf.pin_image_digest for spark_conf in self.spark_confs}:
+            get_nexus_paths([spark_conf.image for spark_conf in self.spark_confs
+                             if spark_conf.pin_image_digest == pin_digest],
+                            max_workers=self.max_workers, pin_digest=pin_digest)
+        # applications of the previous try of this task, they share the batch id
+        existing = self.get_applications(batch_id)
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = [executor.submit(self.submit, spark_conf, batch_id, context, existing)
+                       for spark_conf in self.spark_confs]
+        names, errors = [], []
+        for future in futures:
+            try:
+                names.append(future.result())
+            except Exception as e:
+                errors.append(e)
+        if errors:
+            self.log.error("%s of %s submissions failed, deleting the submitted ones", len(errors), len(futures))
+            self.delete(names)
+            raise errors[0]
+
+        return self.monitor(batch_id, names, ti)
+
+    def monitor(self, batch_id: str, names: List[str], ti: Any) -> Dict[str, Optional[str]]:
+        results: Dict[str, Optional[str]] = {name: None for name in names}
+        seen = set()
+        started = time.monotonic()
+        while True:
+            states = self.get_states(batch_id)
+            for name, state in results.items():
+                if state in FAILURE_STATES or state in SUCCESS_STATES:
+                    continue
+                if name in states:
+                    seen.add(name)
+                    results[name] = states[name]
+                elif name in seen or time.monotonic() - started > self.MISSING_GRACE_SECONDS:
+                    self.log.warning("sparkApplication %s disappeared before it finished", name)
+                    results[name] = self.MISSING_STATE
+            failed = [name for name, state in results.items() if state in FAILURE_STATES]
+            running = [name for name, state in results.items()
+                       if state not in FAILURE_STATES and state not in SUCCESS_STATES]
+            if failed and self.failure_policy == "fail_fast":
+                ti.xcom_push(key="return_value", value=results)
+                self.delete(running)
+                raise AirflowException(f"Spark applications failed: {failed}")
+            if not running:
+                break
+            if self.timeout is not None and time.monotonic() - started > self.timeout:
+                ti.xcom_push(key="return_value", value=results)
+                self.delete(running)
+                raise AirflowException(f"Spark applications did not finish in {self.timeout}s: {running}")
+            self.log.info("%s of %s spark applications are still running", len(running), len(names))
+            time.sleep(self.poll_interval)
+
+        if failed:
+            # failed tasks do not push return values, so the results are pushed explicitly
+            ti.xcom_push(key="return_value", value=results)
+            raise AirflowException(f"Spark applications failed: {failed}")
+        return results
@@ -0,0 +1,170 @@
+import random
+import threading
+import time
+from functools import wraps
+from typing import Any, Callable, Dict, Optional
+
+from airflow.exceptions import AirflowException
+from kubernetes.client.rest import ApiException
+from loguru import logger
+from urllib3.exceptions import ConnectTimeoutError, HTTPError, MaxRetryError
+
+RETRYABLE_STATUSES = (0, 429, 500, 502, 503, 504)
+
+# set while a resilient call runs in the thread, nested resilient calls are not retried again
+_state = threading.local()
+
+
+class CircuitOpenError(AirflowException):
+    """Raised instead of a submission while the api server of the cluster is failing"""
+
+
+def get_retry_after(exc: Exception) -> Optional[float]:
+    headers = getattr(exc, "headers", None)
+    if not headers:
+        return None
+    try:
+        return float(headers.get("Retry-After"))
+    except (TypeError, ValueError):
+        return None
+
+
+def is_connect_error(exc: Exception) -> bool:
+    """True if the request failed before it reached the api server"""
+    if isinstance(exc, MaxRetryError):
+        exc = exc.reason
+    return isinstance(exc, (ConnectTimeoutError, ConnectionRefusedError))
+
+
+def is_retryable(exc: Exception, idempotent: bool = True) -> bool:
+    """
+    Transport errors and throttling or server errors of the api are retried, anything else is not.
+    A non-idempotent request (submission) is retried only if it surely was not applied:
+    on throttling (429) or when the connection could not be established
+    """
+    if isinstance(exc, ApiException):
+        return exc.status == 429 if not idempotent else exc.status in RETRYABLE_STATUSES
+    if not idempotent:
+        return is_connect_error(exc)
+    return isinstance(exc, (HTTPError, OSError))
+
+
+class RetryPolicy:
+    """
+    Exponential backoff with full jitter, honours HTTP 429 Retry-After.
+    Args:
+        tries (int): attempts including the first one
+        base_delay (float): delay cap of the first retry in seconds
+        max_delay (float): maximum delay in seconds
+    """
+
+    def __init__(self, tries: int = 5, base_delay: float = 1, max_delay: float = 30) -> None:
+        self.tries = tries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def get_delay(self, attempt: int, exc: Exception) -> float:
+        retry_after = get_retry_after(exc)
+        if retry_after is not None:
+            return min(retry_after, self.max_delay)
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    def call(self, func: Callable, *args: Any, idempotent: bool = True, **kwargs: Any) -> Any:
+        for attempt in range(self.tries):
+            try:
+                return func(*args, **kwargs)
+            except Exception as e:
+                if attempt == self.tries - 1 or not is_retryable(e, idempotent):
+                    raise
+                delay = self.get_delay(attempt, e)
+                logger.warning(f"{func.__name__} failed: {e}, retrying in {delay:.1f}s")
+                time.sleep(delay)
+
+
+class CircuitBreaker:
+    """
+    Opens after `failure_threshold` consecutive failures and rejects submissions for `reset_timeout` seconds,
+    then lets one call through (half-open) and closes on success.
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 60) -> None:
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self.lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self.lock:
+            if self.opened_at is None:
+                return True
+            if time.monotonic() - self.opened_at >= self.reset_timeout:
+                # half-open: the next failure opens the breaker again
+                self.opened_at = None
+                self.failures = self.failure_threshold - 1
+                return True
+            return False
+
+    def record_success(self) -> None:
+        with self.lock:
+            self.failures = 0
+            self.opened_at = None
+
+    def record_failure(self) -> None:
+        with self.lock:
+            self.failures += 1
+            if self.failures >= self.failure_threshold and self.opened_at is None:
+                self.opened_at = time.monotonic()
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_breakers_lock = threading.Lock()
+
+
+def get_circuit_breaker(cluster: str) -> CircuitBreaker:
+    """Returns the breaker shared by the process for the cluster (connection id)"""
+    with _breakers_lock:
+        if cluster not in _breakers:
+            _breakers[cluster] = CircuitBreaker()
+        return _breakers[cluster]
+
+
+def resilient(submission: bool = False) -> Callable:
+    """
+    Hook method decorator: runs the call with the hook retry policy and reports the outcome
+    to the cluster circuit breaker. Submissions are rejected while the breaker is open,
+    and they are not retried when the request may have been applied (timeouts, 5xx).
+    The policy applies to the outermost decorated call only, methods called from inside it
+    (get_conn, parent hook methods) run once and their errors are retried by the outer call.
+    """
+
+    def decorator(func: Callable) -> Callable:
+        @wraps(func)
+        def wrapper(self: Any, *args: Any, **kwargs: Any) -> Any:
+            if getattr(_state, "active", False):
+                return func(self, *args, **kwargs)
+            breaker = get_circuit_breaker(self.conn_id or "default")
+            if submission and not breaker.allow():
+                raise CircuitOpenError(f"Kubernetes api server of {self.conn_id} is failing, submission is postponed")
+            _state.active = True
+            try:
+                try:
+                    result = self.retry_policy.call(func, self, *args, idempotent=not submission, **kwargs)
+                except ApiException as e:
+                    # expired credentials: drop the cached client and try once more with a fresh one
+                    if e.status != 401 or not hasattr(self, "invalidate_conn"):
+                        raise
+                    self.invalidate_conn()
+                    result = self.retry_policy.call(func, self, *args, idempotent=not submission, **kwargs)
+            except Exception as e:
+                if is_retryable(e):
+                    breaker.record_failure()
+                raise
+            finally:
+                _state.active = False
+            breaker.record_success()
+            return result
+
+        return wrapper
+
+    return decorator
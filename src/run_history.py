@@ -0,0 +1,167 @@
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+from dagify.constants import AUTO_SIZE_DEFAULT_BOUNDS, FAILURE_STATES, SUCCESS_STATES
+
+RUN_HISTORY_DB = Path(os.environ.get("DAGIFY_RUN_HISTORY_DB", Path(tempfile.gettempdir()) / "dagify-run-history.sqlite"))
+OOM_MARKERS = ("OOMKilled", "OutOfMemory", "exit code 137", "Exit code: 137")
+# memory proposed after stable runs: peak pod usage (heap + overhead) with a margin
+PEAK_USAGE_HEADROOM = 1.25
+PEAK_USAGE_COLUMNS = ("peak_driver_memory_mb", "peak_executor_memory_mb")
+
+_lock = threading.Lock()
+
+
+def memory_to_mb(memory: str) -> int:
+    """'600m' -> 600, '2g' -> 2048"""
+    value, unit = memory[:-1], memory[-1].lower()
+    return int(float(value) * 1024) if unit == "g" else int(float(value))
+
+
+def mb_to_memory(mb: int) -> str:
+    return f"{mb}m"
+
+
+class RunHistoryStore:
+    """
+    Local SQLite store of SparkApplication runs: requested resources, peak memory usage of the driver
+    and of the largest executor pod, duration, final state and failure reasons per application name.
+    """
+
+    def __init__(self, path: Union[str, Path] = RUN_HISTORY_DB) -> None:
+        self.path = str(path)
+        with _lock, sqlite3.connect(self.path) as connection:
+            connection.execute(
+                """
+                CREATE TABLE IF NOT EXISTS runs (
+                    app_name TEXT NOT NULL,
+                    finished_at REAL NOT NULL,
+                    duration_seconds REAL,
+                    final_state TEXT,
+                    driver_memory TEXT,
+                    executor_memory TEXT,
+                    num_executors INTEGER,
+                    failure_reason TEXT
+                )
+                """
+            )
+            connection.execute("CREATE INDEX IF NOT EXISTS runs_app_name ON runs (app_name, finished_at)")
+            columns = {row[1] for row in connection.execute("PRAGMA table_info(runs)")}
+            for column in PEAK_USAGE_COLUMNS:
+                # stores created before peak usage was recorded
+                if column not in columns:
+                    connection.execute(f"ALTER TABLE runs ADD COLUMN {column} REAL")
+
+    def record(
+        self,
+        app_name: str,
+        final_state: Optional[str],
+        duration_seconds: Optional[float],
+        driver_memory: Optional[str],
+        executor_memory: Optional[str],
+        num_executors: Optional[int],
+        failure_reason: Optional[str] = None,
+        peak_driver_memory_mb: Optional[float] = None,
+        peak_executor_memory_mb: Optional[float] = None,
+    ) -> None:
+        with _lock, sqlite3.connect(self.path) as connection:
+            connection.execute(
+                "INSERT INTO runs (app_name, finished_at, duration_seconds, final_state, driver_memory, "
+                "executor_memory, num_executors, failure_reason, peak_driver_memory_mb, peak_executor_memory_mb) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (app_name, time.time(), duration_seconds, final_state,
+                 driver_memory, executor_memory, num_executors, failure_reason,
+                 peak_driver_memory_mb, peak_executor_memory_mb),
+            )
+
+    def record_application(
+        self,
+        response: Dict[str, Any],
+        duration_seconds: Optional[float],
+        peak_usage: Optional[Dict[str, float]] = None,
+    ) -> None:
+        """
+        Records a run from the SparkApplication object as returned by the api server.
+        peak_usage: highest memory usage in MiB observed per spark-role ('driver', 'executor')
+        """
+        peak_usage = peak_usage or {}
+        spec = response.get("spec", {})
+        status = response.get("status", {})
+        reasons = [status.get("applicationState", {}).get("errorMessage", "")]
+        reasons += [f"{executor}: {state}" for executor, state in status.get("executorState", {}).items()
+                    if state in FAILURE_STATES]
+        self.record(
+            app_name=response["metadata"]["name"],
+            final_state=status.get("applicationState", {}).get("state"),
+            duration_seconds=duration_seconds,
+            driver_memory=spec.get("driver", {}).get("memory"),
+            executor_memory=spec.get("executor", {}).get("memory"),
+            num_executors=spec.get("executor", {}).get("instances"),
+            failure_reason="; ".join(reason for reason in reasons if reason) or None,
+            peak_driver_memory_mb=peak_usage.get("driver"),
+            peak_executor_memory_mb=peak_usage.get("executor"),
+        )
+
+    def recent(self, app_name: str, limit: int = 10) -> List[Dict[str, Any]]:
+        with _lock, sqlite3.connect(self.path) as connection:
+            connection.row_factory = sqlite3.Row
+            rows = connection.execute(
+                "SELECT * FROM runs WHERE app_name = ? ORDER BY finished_at DESC LIMIT ?", (app_name, limit)
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+
+def _clamp(value: int, bounds: Tuple[Any, Any], to_int: Any = int) -> int:
+    return max(to_int(bounds[0]), min(to_int(bounds[1]), value))
+
+
+def propose_resources(
+    history: List[Dict[str, Any]],
+    current: Dict[str, Any],
+    bounds: Optional[Dict[str, Tuple[Any, Any]]] = None,
+    stable_runs: int = 3,
+) -> Dict[str, Any]:
+    """
+    Proposes driver_memory, executor_memory and num_executors from recent runs (newest first):
+    after an OOM the memory of the last run is raised by 50%. After `stable_runs` successful runs
+    with unchanged resources memory is lowered to the peak usage of those runs plus PEAK_USAGE_HEADROOM,
+    only if the peak was recorded for every one of them; memory is never lowered without usage evidence
+    and the number of executors is never lowered.
+    Values are kept within `bounds`, `current` is returned when there is no history.
+    """
+    bounds = {**AUTO_SIZE_DEFAULT_BOUNDS, **(bounds or {})}
+    if not history:
+        return dict(current)
+    last = history[0]
+    driver_mb = memory_to_mb(last["driver_memory"] or current["driver_memory"])
+    executor_mb = memory_to_mb(last["executor_memory"] or current["executor_memory"])
+    num_executors = last["num_executors"] or current["num_executors"]
+
+    reason = last["failure_reason"] or ""
+    if last["final_state"] in FAILURE_STATES and any(marker in reason for marker in OOM_MARKERS):
+        if "driver" in reason.lower():
+            driver_mb = int(driver_mb * 1.5)
+        else:
+            executor_mb = int(executor_mb * 1.5)
+    else:
+        recent = history[:stable_runs]
+        resources = {(run["driver_memory"], run["executor_memory"], run["num_executors"]) for run in recent}
+        if len(recent) == stable_runs and len(resources) == 1 \
+                and all(run["final_state"] in SUCCESS_STATES for run in recent):
+            peak_driver = [run.get("peak_driver_memory_mb") for run in recent]
+            peak_executor = [run.get("peak_executor_memory_mb") for run in recent]
+            if None not in peak_driver:
+                driver_mb = min(driver_mb, int(max(peak_driver) * PEAK_USAGE_HEADROOM))
+            if None not in peak_executor:
+                executor_mb = min(executor_mb, int(max(peak_executor) * PEAK_USAGE_HEADROOM))
+
+    return {
+        "driver_memory": mb_to_memory(_clamp(driver_mb, bounds["driver_memory"], memory_to_mb)),
+        "executor_memory": mb_to_memory(_clamp(executor_mb, bounds["executor_memory"], memory_to_mb)),
+        "num_executors": _clamp(num_executors, bounds["num_executors"]),
+    }
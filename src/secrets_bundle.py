@@ -0,0 +1,67 @@
+import threading
+import time
+from typing import Callable, Dict, Sequence, Tuple
+
+from airflow.configuration import ensure_secrets_loaded
+from airflow.models import Variable
+from airflow.secrets.metastore import MetastoreBackend
+from airflow.utils.db import provide_session
+
+from dagify.constants import SECRETS_BUNDLE_TTL_SECONDS
+
+_cache: Dict[Tuple[str, ...], Tuple[float, Dict[str, str]]] = {}
+_cache_lock = threading.Lock()
+
+
+@provide_session
+def fetch_variables(keys: Sequence[str], session=None) -> Dict[str, str]:
+    """
+    Resolves airflow Variables in one batch.
+    Secrets backends are walked in the order airflow uses for Variable.get
+    (custom backend, environment variables, metastore), so the same value wins.
+    Only the metastore step is batched: keys not found by earlier backends
+    are read from the metadata DB in a single query.
+    Raises KeyError for keys missing in every backend, like Variable.get does.
+    """
+    values = {}
+    for backend in ensure_secrets_loaded():
+        missing = [key for key in keys if key not in values]
+        if not missing:
+            break
+        if isinstance(backend, MetastoreBackend):
+            for variable in session.query(Variable).filter(Variable.key.in_(missing)).all():
+                values[variable.key] = variable.val
+            continue
+        for key in missing:
+            value = backend.get_variable(key)
+            if value is not None:
+                values[key] = value
+
+    missing = [key for key in keys if key not in values]
+    if missing:
+        raise KeyError(f"Variables {missing} do not exist")
+    return values
+
+
+def get_secrets_bundle(
+    keys: Sequence[str],
+    ttl: float = SECRETS_BUNDLE_TTL_SECONDS,
+    fetcher: Callable[[Sequence[str]], Dict[str, str]] = fetch_variables,
+) -> Dict[str, str]:
+    """Returns values of all `keys` with one batched lookup, cached per process for `ttl` seconds"""
+    cache_key = tuple(sorted(keys))
+    now = time.monotonic()
+    with _cache_lock:
+        cached = _cache.get(cache_key)
+        if cached is not None and cached[0] > now:
+            return dict(cached[1])
+
+    values = fetcher(list(cache_key))
+    with _cache_lock:
+        _cache[cache_key] = (now + ttl, values)
+    return dict(values)
+
+
+def clear_secrets_cache() -> None:
+    with _cache_lock:
+        _cache.clear()
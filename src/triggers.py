@@ -0,0 +1,150 @@
+import asyncio
+import time
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+from airflow.providers.cncf.kubernetes.hooks.kubernetes import AsyncKubernetesHook
+from airflow.triggers.base import BaseTrigger, TriggerEvent
+from kubernetes_asyncio import client as async_client
+from kubernetes_asyncio.client.exceptions import ApiException
+
+from dagify.admission import parse_memory
+from dagify.constants import K8S_DEFAULT_CONF, FAILURE_STATES, SUCCESS_STATES
+from dagify.dag_utils import SPARK_APP_NAME_LABEL
+
+
+def update_peak_usage(peak_usage: Dict[str, float], pod_metrics: List[Dict[str, Any]]) -> None:
+    """Keeps the highest memory usage in MiB of the driver and of one executor pod from metrics.k8s.io PodMetrics"""
+    for pod in pod_metrics:
+        role = pod["metadata"].get("labels", {}).get("spark-role")
+        if role not in ("driver", "executor"):
+            continue
+        usage = sum(parse_memory(container["usage"]["memory"]) for container in pod.get("containers", []))
+        peak_usage[role] = max(peak_usage.get(role, 0), usage)
+
+
+class SparkApplicationTrigger(BaseTrigger):
+    """
+    Watches status.applicationState.state of a SparkApplication in the triggerer
+    and fires only when the application reaches a terminal state.
+    Events carry the observed state transitions and the number of polls for SparkRunTimeline,
+    and with sample_usage_interval the peak memory usage of the pods for the run history.
+
+    Args:
+        name (str): SparkApplication name
+        namespace (str): SparkApplication namespace
+        kubernetes_conn_id (str): airflow connection id
+        poll_interval (float): seconds between status checks
+        max_failures (int): consecutive api errors tolerated before the task fails,
+            a missing application (404) fails it right away
+        sample_usage_interval (float): seconds between pod memory samples from metrics-server, not sampled if None
+    """
+
+    def __init__(
+        self,
+        name: str,
+        namespace: str,
+        kubernetes_conn_id: Optional[str] = 'kubernetes_default',
+        poll_interval: float = 10,
+        max_failures: int = 5,
+        sample_usage_interval: Optional[float] = None,
+    ) -> None:
+        super().__init__()
+        self.name = name
+        self.namespace = namespace
+        self.kubernetes_conn_id = kubernetes_conn_id
+        self.poll_interval = poll_interval
+        self.max_failures = max_failures
+        self.sample_usage_interval = sample_usage_interval
+
+    def serialize(self) -> Tuple[str, Dict[str, Any]]:
+        return (
+            "dagify.triggers.SparkApplicationTrigger",
+            {
+                "name": self.name,
+                "namespace": self.namespace,
+                "kubernetes_conn_id": self.kubernetes_conn_id,
+                "poll_interval": self.poll_interval,
+                "max_failures": self.max_failures,
+                "sample_usage_interval": self.sample_usage_interval,
+            },
+        )
+
+    async def get_application_state(self, api: async_client.CustomObjectsApi) -> Optional[str]:
+        response = await api.get_namespaced_custom_object(
+            group=K8S_DEFAULT_CONF['api_group'],
+            version=K8S_DEFAULT_CONF['api_version'],
+            plural=K8S_DEFAULT_CONF['plural'],
+            name=self.name,
+            namespace=self.namespace,
+        )
+        return response.get("status", {}).get("applicationState", {}).get("state")
+
+    async def sample_peak_usage(self, api: async_client.CustomObjectsApi, peak_usage: Dict[str, float]) -> None:
+        try:
+            response = await api.list_namespaced_custom_object(
+                group="metrics.k8s.io",
+                version="v1beta1",
+                plural="pods",
+                namespace=self.namespace,
+                label_selector=f"{SPARK_APP_NAME_LABEL}={self.name}",
+            )
+        except Exception as e:
+            # metrics-server is optional, without it memory is only ever raised after OOM
+            self.log.warning("Can not read pod metrics of %s: %s", self.name, e)
+            return
+        update_peak_usage(peak_usage, response["items"])
+
+    async def run(self) -> AsyncIterator[TriggerEvent]:
+        hook = AsyncKubernetesHook(conn_id=self.kubernetes_conn_id)
+        failures = 0
+        # state transitions in SparkRunTimeline format
+        timeline = {"events": [], "polls": 0}
+        last_state = None
+        peak_usage: Dict[str, float] = {}
+        last_usage_sample = 0.0
+        try:
+            async with hook.get_conn() as connection:
+                api = async_client.CustomObjectsApi(connection)
+                while True:
+                    try:
+                        state = await self.get_application_state(api)
+                    except ApiException as e:
+                        if e.status == 404:
+                            yield TriggerEvent({"status": "error", "name": self.name,
+                                                "message": "SparkApplication not found", "timeline": timeline, "peak_usage": peak_usage})
+                            return
+                        failures += 1
+                        error = e
+                    except Exception as e:
+                        failures += 1
+                        error = e
+                    else:
+                        failures = 0
+                        timeline["polls"] += 1
+                        if state != last_state:
+                            timeline["events"].append((f"state:{state}", time.time()))
+                            last_state = state
+                        if state in SUCCESS_STATES:
+                            yield TriggerEvent({"status": "success", "name": self.name, "state": state,
+                                                "timeline": timeline, "peak_usage": peak_usage})
+                            return
+                        if state in FAILURE_STATES:
+                            yield TriggerEvent({"status": "failed", "name": self.name, "state": state,
+                                                "timeline": timeline, "peak_usage": peak_usage})
+                            return
+                        self.log.info("Spark application %s is in state: %s", self.name, state)
+                        if self.sample_usage_interval is not None \
+                                and time.monotonic() - last_usage_sample >= self.sample_usage_interval:
+                            last_usage_sample = time.monotonic()
+                            await self.sample_peak_usage(api, peak_usage)
+
+                    if failures >= self.max_failures:
+                        yield TriggerEvent({"status": "error", "name": self.name, "message": str(error),
+                                            "timeline": timeline, "peak_usage": peak_usage})
+                        return
+                    if failures:
+                        self.log.warning("Can not get state of %s (%s/%s): %s",
+                                         self.name, failures, self.max_failures, error)
+                    await asyncio.sleep(self.poll_interval)
+        except Exception as e:
+            yield TriggerEvent({"status": "error", "name": self.name, "message": str(e), "timeline": timeline, "peak_usage": peak_usage})
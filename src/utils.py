@@ -1,21 +1,145 @@
+import hashlib
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+from functools import lru_cache
 from pathlib import Path
-from typing import Any, Dict, Union
+from typing import Any, Callable, Dict, Optional, Tuple, Union
 
-from airflow.models import Variable
-import boto3
+from loguru import logger
 from omegaconf import DictConfig, ListConfig, OmegaConf
 
+from dagify.constants import (
+    MERGED_CONFIG_CACHE_MAX_FILES,
+    MERGED_CONFIG_CACHE_PRUNE_INTERVAL,
+    S3_CONFIG_CACHE_TTL_SECONDS,
+)
+from dagify.secrets_bundle import get_secrets_bundle
+
+CONFIG_CACHE_DIR = Path(os.environ.get("DAGIFY_CONFIG_CACHE_DIR", Path(tempfile.gettempdir()) / "dagify-configs"))
+
+# (bucket, key) -> (etag, checked_at, content)
+_config_cache: Dict[Tuple[str, str], Tuple[str, float, str]] = {}
+_config_cache_lock = threading.Lock()
+
+# merged configs written by this process, the cache directory is pruned every MERGED_CONFIG_CACHE_PRUNE_INTERVAL writes
+_merged_writes = 0
+_merged_writes_lock = threading.Lock()
+
+# ${resolver:...} interpolations (oc.env, custom resolvers) may give another value on every call
+RESOLVER_PATTERN = re.compile(r"\$\{[\w.]+:")
+
+
+@lru_cache(maxsize=None)
+def get_s3_client(S3_ENDPOINT: str, ACCESS_KEY: str, SECRET_KEY: str) -> Any:
+    """boto3 client shared by the process, with a connection pool and short timeouts"""
+    import boto3
+    from botocore.config import Config
+
+    return boto3.client("s3",
+                        aws_access_key_id=ACCESS_KEY,
+                        aws_secret_access_key=SECRET_KEY,
+                        endpoint_url=S3_ENDPOINT,
+                        config=Config(max_pool_connections=20,
+                                      connect_timeout=5,
+                                      read_timeout=10,
+                                      retries={"max_attempts": 2}))
+
+
+def _cache_entry_path(cache_key: Tuple[str, str]) -> Path:
+    return CONFIG_CACHE_DIR / (hashlib.sha256("/".join(cache_key).encode()).hexdigest() + ".json")
+
+
+def _read_cache(cache_key: Tuple[str, str]) -> Optional[Tuple[str, float, str]]:
+    with _config_cache_lock:
+        if cache_key in _config_cache:
+            return _config_cache[cache_key]
+    try:
+        entry = json.loads(_cache_entry_path(cache_key).read_text())
+        content = (CONFIG_CACHE_DIR / entry["content"]).read_text()
+    except (OSError, ValueError, KeyError):
+        return None
+    return entry["etag"], entry["checked_at"], content
+
+
+def _write_cache(cache_key: Tuple[str, str], etag: str, checked_at: float, content: str) -> None:
+    with _config_cache_lock:
+        _config_cache[cache_key] = (etag, checked_at, content)
+    try:
+        CONFIG_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        # content files are addressed by hash, so equal configs share one file
+        content_name = hashlib.sha256(content.encode()).hexdigest() + ".yaml"
+        content_path = CONFIG_CACHE_DIR / content_name
+        if not content_path.exists():
+            content_path.write_text(content)
+        entry_path = _cache_entry_path(cache_key)
+        tmp_path = entry_path.with_suffix(f".{os.getpid()}.tmp")
+        tmp_path.write_text(json.dumps({"etag": etag, "checked_at": checked_at, "content": content_name}))
+        tmp_path.replace(entry_path)
+    except OSError as e:
+        logger.warning(f"Can not write config cache to {CONFIG_CACHE_DIR}: {e}")
+
+
+def prune_cache_dir(directory: Path, max_files: int) -> None:
+    """Deletes the least recently used files (by mtime) beyond `max_files`"""
+    try:
+        entries = []
+        for path in directory.glob("*.json"):
+            try:
+                entries.append((path.stat().st_mtime, path))
+            except OSError:
+                pass
+        entries.sort()
+        for _, path in entries[:max(0, len(entries) - max_files)]:
+            path.unlink(missing_ok=True)
+    except OSError as e:
+        logger.warning(f"Can not prune config cache {directory}: {e}")
+
 
 def load_config(
-    S3_ENDPOINT: str, bucket: str, key: str, ACCESS_KEY: str, SECRET_KEY: str
+    bucket: str, key: str, get_credentials: Callable[[], Dict[str, str]],
+    ttl: float = S3_CONFIG_CACHE_TTL_SECONDS,
 ) -> Union[DictConfig, ListConfig]:
-    s3 = boto3.client("s3", 
-                      aws_access_key_id=ACCESS_KEY,
-                      aws_secret_access_key=SECRET_KEY,
-                      endpoint_url=S3_ENDPOINT)
+    """
+    Loads a config from S3 through an in-memory and on-disk cache.
+    After `ttl` seconds the cached config is revalidated with a conditional GET (IfNoneMatch).
+    If S3 is unavailable a stale cached config is used.
+    get_credentials returns S3_ENDPOINT, aws_access_key_id and aws_secret_access_key, it is called only
+    on a cache miss or revalidation, so a DAG parse with a fresh cache does not read secrets.
+    """
+    cache_key = (bucket, key)
+    cached = _read_cache(cache_key)
+    now = time.time()
+    if cached is not None and now - cached[1] < ttl:
+        return OmegaConf.create(cached[2])
+
+    from botocore.exceptions import BotoCoreError, ClientError
+
+    credentials = get_credentials()
+    s3 = get_s3_client(credentials["S3_ENDPOINT"], credentials["aws_access_key_id"],
+                       credentials["aws_secret_access_key"])
+    request = {"Bucket": bucket, "Key": key}
+    if cached is not None:
+        request["IfNoneMatch"] = cached[0]
+    try:
+        response = s3.get_object(**request)
+    except ClientError as e:
+        if cached is not None and e.response["ResponseMetadata"]["HTTPStatusCode"] == 304:
+            _write_cache(cache_key, cached[0], now, cached[2])
+            return OmegaConf.create(cached[2])
+        raise
+    except BotoCoreError as e:
+        if cached is None:
+            raise
+        logger.warning(f"S3 is unavailable, using cached s3://{bucket}/{key}: {e}")
+        return OmegaConf.create(cached[2])
 
-    response = s3.get_object(Bucket=bucket, Key=key)
-    return OmegaConf.load(response["Body"])
+    content = response["Body"].read().decode()
+    _write_cache(cache_key, response["ETag"], now, content)
+    return OmegaConf.create(content)
 
 
 class SparkJobConfig:
@@ -28,16 +152,67 @@ class SparkJobConfig:
     ):
 
         if s3_conf:
-            S3_ENDPOINT = Variable.get('S3_ENDPOINT')
-            ACCESS_KEY = Variable.get('aws_access_key_id')
-            SECRET_KEY = Variable.get('aws_secret_access_key')
             self.base_config = load_config(
-                S3_ENDPOINT=S3_ENDPOINT, bucket=bucket, key=key, ACCESS_KEY=ACCESS_KEY, SECRET_KEY=SECRET_KEY
+                bucket=bucket,
+                key=key,
+                get_credentials=lambda: get_secrets_bundle(("S3_ENDPOINT", "aws_access_key_id", "aws_secret_access_key")),
             )
         else:
             self.base_config = OmegaConf.load(key)
+        base_yaml = OmegaConf.to_yaml(self.base_config)
+        self.base_config_hash = hashlib.sha256(base_yaml.encode()).hexdigest()
+        self.base_config_cacheable = RESOLVER_PATTERN.search(base_yaml) is None
 
     def merge(self, job_config_filepath: Union[str, Path]) -> Dict[str, Any]:
+        """
+        Merges the job config into the base config.
+        Results are cached on disk in CONFIG_CACHE_DIR by hash of the base config and the job config content,
+        so every DAG parse process reuses them. Configs with resolver interpolations are always merged.
+        The cache keeps the MERGED_CONFIG_CACHE_MAX_FILES most recently used configs
+        """
+        content = Path(job_config_filepath).read_bytes()
+        if not self.base_config_cacheable or RESOLVER_PATTERN.search(content.decode(errors="ignore")):
+            return self._merge(job_config_filepath)
+
+        cache_path = CONFIG_CACHE_DIR / "merged" / (
+            hashlib.sha256(self.base_config_hash.encode() + content).hexdigest() + ".json"
+        )
+        try:
+            merged = json.loads(cache_path.read_text())
+        except (OSError, ValueError):
+            pass
+        else:
+            try:
+                # mtime is the last use for pruning
+                os.utime(cache_path)
+            except OSError:
+                pass
+            return merged
+
+        merged = self._merge(job_config_filepath)
+        try:
+            serialized = json.dumps(merged)
+            # non-string keys and non-json values would not survive the round trip
+            if json.loads(serialized) == merged:
+                cache_path.parent.mkdir(parents=True, exist_ok=True)
+                tmp_path = cache_path.with_suffix(f".{os.getpid()}.tmp")
+                tmp_path.write_text(serialized)
+                tmp_path.replace(cache_path)
+                self._count_merged_write(cache_path.parent)
+        except (OSError, TypeError, ValueError) as e:
+            logger.warning(f"Can not write merged config cache to {CONFIG_CACHE_DIR}: {e}")
+        return merged
+
+    @staticmethod
+    def _count_merged_write(directory: Path) -> None:
+        global _merged_writes
+        with _merged_writes_lock:
+            _merged_writes += 1
+            prune = (_merged_writes - 1) % MERGED_CONFIG_CACHE_PRUNE_INTERVAL == 0
+        if prune:
+            prune_cache_dir(directory, MERGED_CONFIG_CACHE_MAX_FILES)
+
+    def _merge(self, job_config_filepath: Union[str, Path]) -> Dict[str, Any]:
         user_spark_job_config = OmegaConf.load(job_config_filepath)
         user_spark_job_config = OmegaConf.merge(self.base_config, user_spark_job_config)
         OmegaConf.resolve(user_spark_job_config)
@@ -0,0 +1,92 @@
+import time
+
+import pytest
+from kubernetes import client
+
+from dagify.admission import AdmissionController, get_requested_resources, parse_memory
+
+
+def application(name: str, state=None, app_type: str = "Scala", dynamic_allocation=None) -> dict:
+    spec = {
+        "type": app_type,
+        "driver": {"cores": 1, "memory": "1g"},
+        "executor": {"cores": 2, "memory": "2g", "instances": 2},
+    }
+    if dynamic_allocation:
+        spec["dynamicAllocation"] = dynamic_allocation
+    body = {"metadata": {"name": name}, "spec": spec}
+    if state:
+        body["status"] = {"applicationState": {"state": state}}
+    return body
+
+
+def pod(app_name: str, cpu: str, memory: str) -> client.V1Pod:
+    return client.V1Pod(
+        metadata=client.V1ObjectMeta(labels={"sparkoperator.k8s.io/app-name": app_name}),
+        spec=client.V1PodSpec(containers=[client.V1Container(
+            name="spark", resources=client.V1ResourceRequirements(requests={"cpu": cpu, "memory": memory}))]),
+    )
+
+
+@pytest.mark.parametrize("quantity, mb", [
+    ("16Gi", 16384), ("512Mi", 512), ("1024Ki", 1), ("1048576", 1), ("1G", 1000 ** 3 / 1024 ** 2),
+])
+def test_parse_memory(quantity: str, mb: float) -> None:
+    assert parse_memory(quantity) == pytest.approx(mb)
+
+
+def test_parse_memory_invalid() -> None:
+    with pytest.raises(ValueError):
+        parse_memory("lots")
+
+
+def test_requested_resources_include_memory_overhead() -> None:
+    assert get_requested_resources(application("job")) == (5, 1408 + 2 * 2432)
+    assert get_requested_resources(application("job", app_type="Python")) == pytest.approx(
+        (5, 1024 + 409.6 + 2 * (2048 + 819.2)))
+
+
+def test_requested_resources_of_dynamic_allocation() -> None:
+    body = application("job", dynamic_allocation={"enabled": True, "initialExecutors": 3, "maxExecutors": 10})
+    assert get_requested_resources(body) == (7, 1408 + 3 * 2432)
+
+
+def test_admitted_applications_are_counted_until_their_pods_exist(monkeypatch) -> None:
+    class CoreApi:
+        def list_namespaced_pod(self, namespace, field_selector):
+            return client.V1PodList(items=[pod("started", "1", "1408Mi")])
+
+    class CustomApi:
+        def list_namespaced_custom_object(self, **kwargs):
+            return {"items": [application("started", "SUBMITTED"), application("admitted"),
+                              application("done", "COMPLETED")]}
+
+    monkeypatch.setattr(AdmissionController, "core_api", property(lambda self: CoreApi()))
+    monkeypatch.setattr(AdmissionController, "custom_api", property(lambda self: CustomApi()))
+    controller = AdmissionController(quota={"cpu": "64", "memory": "64Gi"})
+
+    # the driver of "started" runs, its executors and all of "admitted" are still reserved
+    assert controller.get_free_resources(None) == (64 - 5 - 5, 65536 - 6272 - 6272)
+
+
+def test_waiting_jobs_of_another_node_pool_do_not_block(monkeypatch) -> None:
+    now = time.time()
+    queue = {"big-a": {"cpu": 100, "memory": 100000, "priority": 10, "since": now, "updated": now, "scope": "a"}}
+
+    def update_queue(name, entry):
+        if entry is None:
+            queue.pop(name, None)
+        else:
+            queue[name] = entry
+        return queue
+
+    controller = AdmissionController()
+    monkeypatch.setattr(controller, "_update_queue", update_queue)
+    monkeypatch.setattr(controller, "get_free_resources", lambda node_selector: (10, 20000))
+
+    body = application("job")
+    body["spec"]["driver"]["nodeSelector"] = {"spark": "b"}
+    assert controller.admit("job-b", body)
+
+    body["spec"]["driver"]["nodeSelector"] = {"spark": "a"}
+    assert not controller.admit("job-a", body)
@@ -0,0 +1,85 @@
+import pytest
+
+import dagify.configs
+from dagify.configs import K8sConf, SparkJobConf, get_k8s_body_with_spark
+
+
+def render(monkeypatch, spark_conf: SparkJobConf, k8s_conf: K8sConf) -> dict:
+    monkeypatch.setattr(dagify.configs, "get_nexus_path", lambda image, pin_digest: image + ":1.0.0")
+    monkeypatch.setattr(dagify.configs, "get_secrets_bundle", lambda keys: {key: "secret" for key in keys})
+    return get_k8s_body_with_spark(spark_conf, k8s_conf, {"dag_run": None})
+
+
+def test_gang_scheduling_and_priority(monkeypatch) -> None:
+    spark_conf = SparkJobConf(name="job", image="registry/app", main_application_file="main.py",
+                              node_selector="spark", priority_class_name="pipeline-high")
+    k8s_conf = K8sConf(batch_scheduler="volcano", queue="nightly", priority_class_name="backfill-low")
+    spec = render(monkeypatch, spark_conf, k8s_conf)["spec"]
+
+    assert spec["batchScheduler"] == "volcano"
+    assert spec["batchSchedulerOptions"] == {"queue": "nightly", "priorityClassName": "pipeline-high"}
+    assert spec["driver"]["priorityClassName"] == "pipeline-high"
+    assert spec["executor"]["priorityClassName"] == "pipeline-high"
+
+
+def test_no_batch_scheduler_by_default(monkeypatch) -> None:
+    spark_conf = SparkJobConf(name="job", image="registry/app", main_application_file="main.py", node_selector="spark")
+    spec = render(monkeypatch, spark_conf, K8sConf())["spec"]
+
+    assert "batchScheduler" not in spec
+    assert "priorityClassName" not in spec["driver"]
+
+
+def test_dynamic_allocation(monkeypatch) -> None:
+    spark_conf = SparkJobConf(name="job", image="registry/app", main_application_file="main.py", node_selector="spark",
+                              num_executors=2, max_executors=10, dynamic_allocation=True, executor_idle_timeout="120s")
+    spec = render(monkeypatch, spark_conf, K8sConf())["spec"]
+
+    assert spec["dynamicAllocation"] == {"enabled": True, "initialExecutors": 2, "minExecutors": 0, "maxExecutors": 10}
+    assert spec["sparkConf"]["spark.dynamicAllocation.enabled"] == "true"
+    assert spec["sparkConf"]["spark.dynamicAllocation.shuffleTracking.enabled"] == "true"
+    assert spec["sparkConf"]["spark.dynamicAllocation.executorIdleTimeout"] == "120s"
+
+
+def test_no_dynamic_allocation_by_default(monkeypatch) -> None:
+    spark_conf = SparkJobConf(name="job", image="registry/app", main_application_file="main.py", node_selector="spark")
+    spec = render(monkeypatch, spark_conf, K8sConf())["spec"]
+
+    assert "dynamicAllocation" not in spec
+    assert not any(key.startswith("spark.dynamicAllocation") for key in spec["sparkConf"])
+
+
+def shuffle_conf(**kwargs) -> SparkJobConf:
+    return SparkJobConf(name="job", image="registry/app", main_application_file="main.py", node_selector="spark", **kwargs)
+
+
+def test_shuffle_storage_none() -> None:
+    assert shuffle_conf(shuffle_storage="none").get_shuffle_storage_conf() == {}
+
+
+def test_shuffle_storage_pvc_by_default() -> None:
+    prefix = "spark.kubernetes.executor.volumes.persistentVolumeClaim.spark-local-dir-1"
+    assert shuffle_conf(shuffle_storage_size="100Gi").get_shuffle_storage_conf() == {
+        f"{prefix}.options.claimName": "OnDemand",
+        f"{prefix}.options.storageClass": "yc-network-ssd",
+        f"{prefix}.options.sizeLimit": "100Gi",
+        f"{prefix}.mount.path": "/data",
+        f"{prefix}.mount.readOnly": "false",
+        "spark.local.dir": "/data",
+    }
+
+
+@pytest.mark.parametrize("storage, medium", [("emptydir", None), ("tmpfs", "Memory")])
+def test_shuffle_storage_empty_dir(storage: str, medium: str) -> None:
+    prefix = "spark.kubernetes.executor.volumes.emptyDir.spark-local-dir-1"
+    conf = shuffle_conf(shuffle_storage=storage, shuffle_storage_size="8Gi").get_shuffle_storage_conf()
+
+    assert conf[f"{prefix}.options.sizeLimit"] == "8Gi"
+    assert conf.get(f"{prefix}.options.medium") == medium
+    assert conf["spark.local.dir"] == conf[f"{prefix}.mount.path"] == "/data"
+    assert not any("persistentVolumeClaim" in key for key in conf)
+
+
+def test_tmpfs_shuffle_storage_requires_size(monkeypatch) -> None:
+    with pytest.raises(ValueError, match="shuffle_storage_size"):
+        render(monkeypatch, shuffle_conf(shuffle_storage="tmpfs"), K8sConf())
@@ -0,0 +1,31 @@
+import pytest
+
+from dagify.dag_factory import GraphDag
+
+
+def job(depends_on=None, stage=None) -> dict:
+    return {"depends_on": depends_on or [], "stage": stage, "pool": None, "spark_yaml": {}}
+
+
+def test_get_upstream_stages_and_depends_on() -> None:
+    jobs = {
+        "extract-a": job(stage=1),
+        "extract-b": job(stage=1),
+        "transform": job(stage=5),
+        "load": job(stage=9),
+        "report": job(depends_on=["extract-a"], stage=9),
+        "cleanup": job(),
+    }
+    assert GraphDag.get_upstream(jobs) == {
+        "extract-a": [],
+        "extract-b": [],
+        "transform": ["extract-a", "extract-b"],
+        "load": ["transform"],
+        "report": ["extract-a"],
+        "cleanup": [],
+    }
+
+
+def test_get_upstream_unknown_dependency() -> None:
+    with pytest.raises(ValueError, match="unknown jobs"):
+        GraphDag.get_upstream({"load": job(depends_on=["transform"])})
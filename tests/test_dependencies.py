@@ -0,0 +1,37 @@
+import pytest
+
+import dagify.dependencies
+from dagify.dependencies import DependencyBundle
+
+COORDINATES = ["org.postgresql:postgresql:42.5.0", "com.example:core:1.0"]
+
+
+def test_published_bundle_is_looked_up(monkeypatch, tmp_path) -> None:
+    def fetch(coordinates, repositories, cache_dir):
+        jars = []
+        # two artifacts with the same file name from different groups
+        for group in ("org", "com"):
+            jar = tmp_path / "cache" / group / "core-1.0.jar"
+            jar.parent.mkdir(parents=True)
+            jar.write_bytes(group.encode())
+            jars.append(jar)
+        return jars
+
+    monkeypatch.setattr(dagify.dependencies, "fetch", fetch)
+    bundle = DependencyBundle(storage="pvc", claim_name="jars", mount_path=str(tmp_path / "pvc"))
+    with pytest.raises(ValueError, match="is not mounted"):
+        bundle.get_jars(COORDINATES)
+
+    (tmp_path / "pvc").mkdir()
+    with pytest.raises(ValueError, match="is not published"):
+        bundle.get_jars(COORDINATES)
+
+    jars = bundle.publish(COORDINATES)
+    assert len(set(jars)) == 2
+    assert all(jar.startswith(f"local://{tmp_path / 'pvc'}") for jar in jars)
+    assert bundle.get_jars(reversed(COORDINATES)) == jars
+
+    other_repositories = DependencyBundle(storage="pvc", claim_name="jars", mount_path=str(tmp_path / "pvc"),
+                                          repositories=["https://nexus.example/maven"])
+    with pytest.raises(ValueError, match="is not published"):
+        other_repositories.get_jars(COORDINATES)
@@ -0,0 +1,73 @@
+from kubernetes import client
+from kubernetes.client.rest import ApiException
+
+import dagify.hooks
+import dagify.resilience
+from dagify.constants import API_CLIENT_POOL_MAXSIZE
+from dagify.hooks import CustomKubernetesHook
+
+
+def patch_parent_get_conn(monkeypatch) -> list:
+    created = []
+
+    def get_conn(self) -> client.ApiClient:
+        created.append(self.conn_id)
+        return client.ApiClient(configuration=client.Configuration())
+
+    monkeypatch.setattr(dagify.hooks.KubernetesHook, "get_conn", get_conn)
+    monkeypatch.setattr(dagify.hooks, "_clients", {})
+    monkeypatch.setattr(dagify.resilience, "_breakers", {})
+    return created
+
+
+def test_api_client_is_shared_by_hooks_of_one_connection(monkeypatch) -> None:
+    created = patch_parent_get_conn(monkeypatch)
+
+    first = CustomKubernetesHook(conn_id="k8s").api_client
+    second = CustomKubernetesHook(conn_id="k8s").api_client
+    other = CustomKubernetesHook(conn_id="other").api_client
+
+    assert first is second
+    assert other is not first
+    assert created == ["k8s", "other"]
+    assert first.configuration.connection_pool_maxsize == API_CLIENT_POOL_MAXSIZE
+
+
+def test_unauthorized_call_is_retried_with_a_new_client(monkeypatch) -> None:
+    created = patch_parent_get_conn(monkeypatch)
+    used_clients = []
+
+    def read_namespaced_pod_log(self, **kwargs) -> str:
+        used_clients.append(self.api_client)
+        if len(used_clients) == 1:
+            raise ApiException(status=401)
+        return "log"
+
+    monkeypatch.setattr(client.CoreV1Api, "read_namespaced_pod_log", read_namespaced_pod_log)
+    hook = CustomKubernetesHook(conn_id="k8s")
+
+    assert hook.read_pod_log(name="driver", namespace="spark") == "log"
+    assert len(created) == 2
+    assert used_clients[0] is not used_clients[1]
+    assert hook.api_client is used_clients[1]
+
+
+def test_unauthorized_submission_is_retried_with_a_new_client(monkeypatch) -> None:
+    created = patch_parent_get_conn(monkeypatch)
+    used_clients = []
+
+    def create_namespaced_custom_object(self, **kwargs) -> dict:
+        used_clients.append(self.api_client)
+        if len(used_clients) == 1:
+            raise ApiException(status=401)
+        return kwargs["body"]
+
+    monkeypatch.setattr(client.CustomObjectsApi, "create_namespaced_custom_object", create_namespaced_custom_object)
+    hook = CustomKubernetesHook(conn_id="k8s")
+    assert hook.custom_object_client.api_client is hook.api_client
+
+    body = {"metadata": {"name": "job"}}
+    assert hook.create_custom_object(group="sparkoperator.k8s.io", version="v1beta2", plural="sparkapplications",
+                                     body=body, namespace="spark") == body
+    assert len(created) == 2
+    assert used_clients[0] is not used_clients[1]
@@ -0,0 +1,33 @@
+import dagify.nexus_path_extractor
+from dagify.nexus_path_extractor import get_nexus_path, resolve_nexus_path
+
+ITEMS = [
+    {"version": "1.0.0", "assets": [{"path": "v2/app/manifests/1.0.0", "checksum": {"sha256": "aa"}}]},
+    {"version": "1.1.0", "assets": [{"path": "v2/app/manifests/1.1.0", "checksum": {"sha256": "bb"}}]},
+]
+
+
+def test_tagged_image_is_pinned_from_nexus_search(monkeypatch) -> None:
+    monkeypatch.setattr(dagify.nexus_path_extractor, "search_versions", lambda service_name: ITEMS)
+
+    assert resolve_nexus_path("registry/app:1.0.0", pin_digest=True) == "registry/app:1.0.0@sha256:aa"
+    assert resolve_nexus_path("registry/app:2.0.0", pin_digest=True) == "registry/app:2.0.0"
+    assert resolve_nexus_path("registry/app:1.0.0") == "registry/app:1.0.0"
+
+
+def test_resolved_path_is_shared_through_disk_cache(monkeypatch, tmp_path) -> None:
+    searches = []
+
+    def search_versions(service_name):
+        searches.append(service_name)
+        return ITEMS
+
+    monkeypatch.setattr(dagify.nexus_path_extractor, "search_versions", search_versions)
+    monkeypatch.setattr(dagify.nexus_path_extractor, "CONFIG_CACHE_DIR", tmp_path)
+    monkeypatch.setattr(dagify.nexus_path_extractor, "_cache", {})
+
+    assert get_nexus_path("registry/app:1.1.0", pin_digest=True) == "registry/app:1.1.0@sha256:bb"
+    # another task process starts with an empty memory cache
+    dagify.nexus_path_extractor._cache.clear()
+    assert get_nexus_path("registry/app:1.1.0", pin_digest=True) == "registry/app:1.1.0@sha256:bb"
+    assert searches == ["app"]
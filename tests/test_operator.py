@@ -0,0 +1,131 @@
+import pytest
+from airflow.exceptions import AirflowException
+
+import dagify.operator
+from dagify.metrics import SparkRunTimeline
+from dagify.operator import SparkKubernetesBatchOperator, SparkKubernetesOperator
+
+RESPONSE = {
+    "metadata": {"namespace": "spark"},
+    "status": {"driverInfo": {"podName": "job-dev-driver"}},
+}
+
+
+class ScriptedLogHook:
+    def __init__(self, logs) -> None:
+        self.logs = list(logs)
+        self.calls = []
+
+    def read_pod_log(self, **kwargs) -> str:
+        self.calls.append(kwargs)
+        return self.logs.pop(0)
+
+
+def operator_with_logs(logs, log_max_bytes: int) -> SparkKubernetesOperator:
+    operator = SparkKubernetesOperator(
+        spark_yaml={"metadata": {"name": "job"}, "spec": {"env": [], "args": []}},
+        task_id="job",
+        log_max_bytes=log_max_bytes,
+    )
+    operator.hook = ScriptedLogHook(logs)
+    return operator
+
+
+def test_log_line_longer_than_limit_is_emitted_truncated() -> None:
+    long_line = "2024-01-01T00:00:01.000000000Z " + "x" * 100
+    operator = operator_with_logs([long_line[:64], "2024-01-01T00:00:02Z done\n"], 64)
+
+    operator.log_driver(RESPONSE)
+    assert operator.last_log_timestamp == "2024-01-01T00:00:01.000000000Z"
+
+    operator.log_driver(RESPONSE)
+    assert operator.last_log_timestamp == "2024-01-01T00:00:02.000000000Z"
+
+
+def test_overlap_larger_than_limit_does_not_stall() -> None:
+    seen = "".join(f"2024-01-01T00:00:0{i}.000000000Z line {i}\n" for i in range(1, 6))
+    operator = operator_with_logs([seen[:90], seen[:90]], 90)
+    operator.last_log_timestamp = "2024-01-01T00:00:05.000000000Z"
+
+    operator.log_driver(RESPONSE)
+    assert operator.log_overlap_seconds == 0
+    assert operator.last_log_timestamp == "2024-01-01T00:00:05.000000000Z"
+
+    operator.log_driver(RESPONSE)
+    assert operator.last_log_timestamp > "2024-01-01T00:00:05.000000000Z"
+    since_with_overlap, since_without_overlap = (call["since_seconds"] for call in operator.hook.calls)
+    assert since_with_overlap - since_without_overlap in (4, 5)
+
+
+def test_spec_hash_ignores_resolved_image_and_secrets() -> None:
+    def body(image: str, secret: str) -> dict:
+        return {"spec": {"image": image, "imagePullPolicy": "IfNotPresent", "args": ["--day=1"],
+                         "sparkConf": {"spark.hadoop.fs.s3a.secret.key": secret, "spark.executor.cores": "2"}}}
+
+    spec_hash = SparkKubernetesOperator.get_spec_hash(body("registry/app:1.0@sha256:aa", "old"), "registry/app", "run-1")
+    assert spec_hash == SparkKubernetesOperator.get_spec_hash(body("registry/app:1.1@sha256:bb", "new"), "registry/app", "run-1")
+    assert spec_hash != SparkKubernetesOperator.get_spec_hash(body("registry/app:1.0@sha256:aa", "old"), "registry/app", "run-2")
+
+
+def test_deferred_run_is_recorded_with_trigger_peak_usage(monkeypatch) -> None:
+    recorded = []
+
+    class Store:
+        def record_application(self, response, duration, peak_usage) -> None:
+            recorded.append((response["metadata"]["name"], peak_usage))
+
+    class Hook:
+        def get_custom_object(self, **kwargs) -> dict:
+            return {"metadata": {"name": kwargs["name"]}, "status": {"applicationState": {"state": "COMPLETED"}}}
+
+    class TaskInstance:
+        dag_id = "etl"
+        task_id = "job"
+
+        def xcom_push(self, key, value) -> None:
+            pass
+
+    monkeypatch.setattr(dagify.operator, "RunHistoryStore", Store)
+    operator = operator_with_logs([], 64)
+    operator.record_history = True
+    operator.hook = Hook()
+    event = {"status": "success", "name": operator.name, "state": "COMPLETED",
+             "timeline": {"events": [], "polls": 3}, "peak_usage": {"executor": 900.0}}
+
+    assert operator.execute_complete({"ti": TaskInstance()}, event, timeline=SparkRunTimeline().to_dict())
+    assert recorded == [(operator.name, {"executor": 900.0})]
+
+
+class XComTaskInstance:
+    def __init__(self) -> None:
+        self.xcom = {}
+
+    def xcom_push(self, key, value) -> None:
+        self.xcom[key] = dict(value)
+
+
+def batch_operator_with_states(states, **kwargs) -> SparkKubernetesBatchOperator:
+    operator = SparkKubernetesBatchOperator(spark_confs=[], task_id="batch", poll_interval=0,
+                                            failure_policy="collect_all", **kwargs)
+    operator.get_states = lambda batch_id: states.pop(0) if len(states) > 1 else states[0]
+    operator.delete = lambda names: None
+    return operator
+
+
+def test_batch_application_deleted_before_finishing_fails() -> None:
+    operator = batch_operator_with_states([
+        {"a-dev": "RUNNING", "b-dev": "RUNNING"},
+        {"b-dev": "COMPLETED"},
+    ])
+    ti = XComTaskInstance()
+
+    with pytest.raises(AirflowException, match="a-dev"):
+        operator.monitor("batch", ["a-dev", "b-dev"], ti)
+    assert ti.xcom["return_value"] == {"a-dev": "UNKNOWN", "b-dev": "COMPLETED"}
+
+
+def test_batch_timeout() -> None:
+    operator = batch_operator_with_states([{"a-dev": "RUNNING"}], timeout=0)
+
+    with pytest.raises(AirflowException, match="did not finish"):
+        operator.monitor("batch", ["a-dev"], XComTaskInstance())
@@ -0,0 +1,24 @@
+from dagify.run_history import RunHistoryStore, propose_resources
+
+CURRENT = {'driver_memory': '600m', 'executor_memory': '600m', 'num_executors': 1}
+
+
+def test_propose_resources(tmp_path) -> None:
+    store = RunHistoryStore(tmp_path / "history.sqlite")
+    assert propose_resources(store.recent('job-dev'), CURRENT) == CURRENT
+
+    for _ in range(3):
+        store.record('job-dev', 'COMPLETED', 60, '1g', '2g', 4)
+    # stable runs without recorded usage are no evidence to lower memory
+    assert propose_resources(store.recent('job-dev'), CURRENT) == \
+        {'driver_memory': '1024m', 'executor_memory': '2048m', 'num_executors': 4}
+
+    for peak_executor_mb in (900, 1000, 800):
+        store.record('job-dev', 'COMPLETED', 60, '1g', '2g', 4,
+                     peak_driver_memory_mb=None, peak_executor_memory_mb=peak_executor_mb)
+    assert propose_resources(store.recent('job-dev'), CURRENT) == \
+        {'driver_memory': '1024m', 'executor_memory': '1250m', 'num_executors': 4}
+
+    store.record('job-dev', 'FAILED', 60, '1g', '2g', 4, 'job-dev-exec-1: FAILED; OOMKilled')
+    assert propose_resources(store.recent('job-dev'), CURRENT, {'executor_memory': ('600m', '2500m')}) == \
+        {'driver_memory': '1024m', 'executor_memory': '2500m', 'num_executors': 4}
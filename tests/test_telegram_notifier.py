@@ -0,0 +1,75 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+import dagify.callbacks
+from dagify.callbacks import TelegramCallback
+from dagify.notifiers import TelegramNotifier
+
+
+def start_stub_server(responses):
+    received = []
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            received.append(json.loads(self.rfile.read(int(self.headers["Content-Length"]))))
+            status, body = responses.pop(0) if responses else (200, {"ok": True})
+            data = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, *args):
+            pass
+
+    server = HTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, received
+
+
+def test_notifier_coalesces_messages_per_chat() -> None:
+    server, received = start_stub_server([])
+    notifier = TelegramNotifier("token", base_url=f"http://127.0.0.1:{server.server_port}", digest_window=0.2)
+    notifier.send("first", ["1", "2"])
+    notifier.send("second", ["1", "2"])
+    notifier.flush(timeout=5)
+    server.shutdown()
+
+    assert sorted(message["chat_id"] for message in received) == ["1", "2"]
+    assert all(message["text"] == "2 notifications:\n\nfirst\n\nsecond" for message in received)
+
+
+def test_notifier_respects_retry_after() -> None:
+    server, received = start_stub_server([(429, {"ok": False, "parameters": {"retry_after": 1}})])
+    notifier = TelegramNotifier("token", base_url=f"http://127.0.0.1:{server.server_port}", digest_window=0)
+    notifier.send("failed", ["1"])
+    notifier.flush(timeout=5)
+    server.shutdown()
+
+    assert [message["text"] for message in received] == ["failed", "failed"]
+
+
+def test_callback_delivers_without_explicit_flush(monkeypatch) -> None:
+    server, received = start_stub_server([])
+    notifier = TelegramNotifier("token", base_url=f"http://127.0.0.1:{server.server_port}", digest_window=2)
+    monkeypatch.setattr(dagify.callbacks, "get_telegram_notifier", lambda token: notifier)
+    monkeypatch.setattr(dagify.callbacks.Variable, "get", lambda key: "dev")
+
+    class Dag:
+        dag_id = "etl"
+        last_loaded = "2024-02-13"
+        tags = []
+
+    started = time.monotonic()
+    TelegramCallback(chat_ids=["1"], token="token").on_failure_callback({"dag": Dag()})
+    elapsed = time.monotonic() - started
+    server.shutdown()
+
+    # flush does not wait for the digest window
+    assert elapsed < 1
+
+    assert [message["chat_id"] for message in received] == ["1"]
+    assert "etl" in received[0]["text"]
@@ -0,0 +1,41 @@
+import time
+
+import pytest
+
+import dagify.utils
+from dagify.utils import SparkJobConfig, load_config
+
+
+@pytest.fixture
+def cache_dir(monkeypatch, tmp_path):
+    monkeypatch.setattr(dagify.utils, "CONFIG_CACHE_DIR", tmp_path)
+    monkeypatch.setattr(dagify.utils, "_config_cache", {})
+    return tmp_path
+
+
+def test_fresh_cached_config_is_loaded_without_credentials(cache_dir) -> None:
+    dagify.utils._write_cache(("configs", "base.yaml"), '"etag"', time.time(), "namespace: spark\n")
+    dagify.utils._config_cache.clear()
+
+    def get_credentials():
+        raise AssertionError("credentials must not be read for a fresh cache entry")
+
+    assert load_config("configs", "base.yaml", get_credentials).namespace == "spark"
+
+
+def test_merged_config_cache_keeps_recently_used_files(monkeypatch, cache_dir, tmp_path) -> None:
+    monkeypatch.setattr(dagify.utils, "MERGED_CONFIG_CACHE_MAX_FILES", 2)
+    monkeypatch.setattr(dagify.utils, "MERGED_CONFIG_CACHE_PRUNE_INTERVAL", 1)
+    base = tmp_path / "base.yaml"
+    base.write_text("namespace: spark\n")
+    jobs = []
+    for i in range(3):
+        jobs.append(tmp_path / f"job_{i}.yaml")
+        jobs[-1].write_text(f"name: job-{i}\n")
+    config = SparkJobConfig(key=str(base), s3_conf=False)
+
+    for job in jobs:
+        assert config.merge(job)["name"] == job.stem.replace("_", "-")
+        time.sleep(0.01)
+
+    assert len(list((cache_dir / "merged").glob("*.json"))) == 2